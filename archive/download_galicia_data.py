@@ -1,20 +1,92 @@
 import ee
 import json
 import os
+import sys
 import time
 
-def main():
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.sentinel_composites import get_composites, get_composite_periods, get_period_composite
+from core import ee_client
+from core.spectral_indices import INDEX_BANDS
+
+# Periods per getInfo() when fetching the batched statistics
+STATS_CHUNK_SIZE = 24
+
+def add_index_bands(composite):
+    """Stack the RGB bands and every spectral index into one image"""
+    return composite.select(['B4', 'B3', 'B2']).addBands([
+        composite.normalizedDifference(list(INDEX_BANDS['ndvi'])).rename('NDVI'),
+        composite.normalizedDifference(list(INDEX_BANDS['ndwi'])).rename('NDWI'),
+        composite.normalizedDifference(list(INDEX_BANDS['ndbi'])).rename('NDBI'),
+        composite.normalizedDifference(list(INDEX_BANDS['nbr'])).rename('NBR')
+    ])
+
+def compute_batched_statistics(composites, galicia, chunk_size=STATS_CHUNK_SIZE):
+    """
+    Compute the image count and band/index means of every composite server-side
+    
+    All periods are reduced inside one ee.FeatureCollection with a single mean
+    reducer over the stacked index image, then fetched in chunks of
+    `chunk_size` periods instead of one getInfo() per index per period.
+    
+    Args:
+        composites: ee.ImageCollection from sentinel_composites.get_composites()
+        galicia: ee.Geometry to reduce over
+        chunk_size: Number of periods fetched per getInfo() call
+    
+    Returns:
+        dict: Period start date -> {'name', 'end', 'image_count', 'B4', 'B3', 'B2', 'NDVI', ...}
+    """
+    def period_statistics(composite):
+        image_count = ee.Number(composite.get('image_count'))
+        
+        # An empty month has no bands to reduce, so only reduce when there are images
+        means = ee.Dictionary(ee.Algorithms.If(
+            image_count.gt(0),
+            add_index_bands(composite).reduceRegion(
+                reducer=ee.Reducer.mean(),
+                geometry=galicia,
+                scale=1000,
+                maxPixels=1e9
+            ),
+            ee.Dictionary({})
+        ))
+        return ee.Feature(None, means.combine(composite.toDictionary(['name', 'start', 'end', 'image_count'])))
+    
+    statistics = ee.FeatureCollection(composites.map(period_statistics))
+    
+    # The period count is only known server-side, so keep fetching until a short chunk
+    results = {}
+    offset = 0
+    while True:
+        print(f"  Fetching statistics for periods {offset + 1}-{offset + chunk_size}...")
+        chunk = ee_client.get_info(statistics.toList(chunk_size, offset))
+        for feature in chunk:
+            properties = feature['properties']
+            results[properties.pop('start')] = properties
+        if len(chunk) < chunk_size:
+            break
+        offset += chunk_size
+    
+    return results
+
+def reduce_mean(image, galicia, period_stats=None):
+    """Mean of each band over Galicia, taken from the batched statistics when available"""
+    if period_stats is not None:
+        return period_stats
+    return ee_client.get_info(image.reduceRegion({
+        'reducer': ee.Reducer.mean(),
+        'geometry': galicia,
+        'scale': 1000,
+        'maxPixels': 1e9
+    }))
+
+def main(batch_stats=True):
     print("Starting background download of Galicia data...")
     
     # Authenticate and initialize Earth Engine
-    try:
-        ee.Initialize(project="ee-nikolaslafrentz")
-        print("Earth Engine initialized successfully")
-    except Exception as e:
-        print(f"Error initializing Earth Engine: {e}")
-        ee.Authenticate()
-        ee.Initialize(project="ee-nikolaslafrentz")
-        print("Earth Engine initialized after authentication")
+    ee_client.initialize(authenticate=True)
+    print("Earth Engine initialized successfully")
     
     # Define the Galicia region boundaries (approximate coordinates)
     galicia = ee.Geometry.Polygon([
@@ -24,35 +96,9 @@ def main():
          [-6.767578, 41.862611]]
     ])
     
-    # Define time periods (monthly from 2018-2023)
-    time_periods = []
-    
-    # Generate monthly periods for multiple years
-    years = [2018, 2019, 2020, 2021, 2022, 2023]
-    months = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]
-    
-    for year in years:
-        for month in months:
-            # Determine last day of month
-            if month in [4, 6, 9, 11]:
-                last_day = 30
-            elif month == 2:
-                # Simple leap year check
-                if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
-                    last_day = 29
-                else:
-                    last_day = 28
-            else:
-                last_day = 31
-            
-            # Format month and create period
-            month_name = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'][month-1]
-            period = {
-                'start': f'{year}-{month:02d}-01',
-                'end': f'{year}-{month:02d}-{last_day}',
-                'name': f'{month_name} {year}'
-            }
-            time_periods.append(period)
+    # Monthly median composites from 2018-2023, grouped on the server from a
+    # single filtered collection
+    composites = get_composites(galicia, '2018-01-01', '2023-12-31', period='month', cloud_max=30)
     
     # Define spectral indices with descriptions
     spectral_indices = [
@@ -93,23 +139,32 @@ def main():
     if not os.path.exists(data_dir):
         os.makedirs(data_dir)
     
+    # Only periods that haven't been saved yet need any Earth Engine work
+    saved_starts = [
+        filename.split('_')[1] for filename in os.listdir(data_dir)
+        if filename.startswith('galicia_') and filename.endswith('.json')
+    ]
+    pending = composites.filter(ee.Filter.inList('start', saved_starts).Not())
+    
+    # Reduce all pending periods in a handful of requests up front; the
+    # statistics also carry each period's name, dates and image count
+    batched_stats = {}
+    if batch_stats:
+        print("Computing batched statistics for all pending periods...")
+        batched_stats = compute_batched_statistics(pending, galicia)
+        time_periods = [
+            {'name': stats['name'], 'start': start, 'end': stats['end'], 'imageCount': stats['image_count']}
+            for start, stats in batched_stats.items()
+        ]
+    else:
+        time_periods = get_composite_periods(pending)
+    
     # Process each time period
     for period in time_periods:
         print(f"Processing {period['name']}...")
-        
-        # Check if this period already exists in saved data
         period_filename = os.path.join(data_dir, f"galicia_{period['start']}_{period['end']}.json")
-        if os.path.exists(period_filename):
-            print(f"  Data for {period['name']} already exists, skipping")
-            continue
         
-        # Get Sentinel-2 surface reflectance data for the period
-        sentinel = ee.ImageCollection('COPERNICUS/S2_SR') \
-            .filterBounds(galicia) \
-            .filterDate(period['start'], period['end']) \
-            .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 30))
-        
-        image_count = sentinel.size().getInfo()
+        image_count = period['imageCount']
         print(f"  Found {image_count} Sentinel-2 images")
         
         # Skip if no images found
@@ -117,8 +172,10 @@ def main():
             print(f"  No images found for {period['name']}, skipping")
             continue
         
-        # Create a median composite for this period
-        composite = sentinel.median()
+        period_stats = batched_stats.get(period['start'])
+        
+        # Median composite for this period, shared with the statistics stage
+        composite = get_period_composite(composites, period['start'])
         
         # Initialize period data
         period_data = {
@@ -137,12 +194,7 @@ def main():
                     # RGB true color image
                     index_image = composite
                     # Calculate average RGB values across the region
-                    rgb_stats = composite.select(['B4', 'B3', 'B2']).reduceRegion({
-                        'reducer': ee.Reducer.mean(),
-                        'geometry': galicia,
-                        'scale': 1000,
-                        'maxPixels': 1e9
-                    }).getInfo()
+                    rgb_stats = reduce_mean(composite.select(['B4', 'B3', 'B2']), galicia, period_stats)
                     
                     # Calculate a simple RGB score (0-100 scale)
                     r_val = rgb_stats['B4'] / 3000 * 100 if 'B4' in rgb_stats else 0
@@ -159,15 +211,10 @@ def main():
                 elif index['id'] == 'ndvi':
                     # NDVI - Normalized Difference Vegetation Index
                     # (NIR - Red) / (NIR + Red)
-                    index_image = composite.normalizedDifference(['B8', 'B4']).rename('NDVI')
+                    index_image = composite.normalizedDifference(list(INDEX_BANDS['ndvi'])).rename('NDVI')
                     
                     # Calculate average NDVI across the region
-                    ndvi_stats = index_image.reduceRegion({
-                        'reducer': ee.Reducer.mean(),
-                        'geometry': galicia,
-                        'scale': 1000,
-                        'maxPixels': 1e9
-                    }).getInfo()
+                    ndvi_stats = reduce_mean(index_image, galicia, period_stats)
                     
                     # Get the NDVI value and convert to 0-100 scale
                     ndvi_value = ndvi_stats.get('NDVI', 0)
@@ -184,15 +231,10 @@ def main():
                 elif index['id'] == 'ndwi':
                     # NDWI - Normalized Difference Water Index
                     # (Green - NIR) / (Green + NIR)
-                    index_image = composite.normalizedDifference(['B3', 'B8']).rename('NDWI')
+                    index_image = composite.normalizedDifference(list(INDEX_BANDS['ndwi'])).rename('NDWI')
                     
                     # Calculate average NDWI across the region
-                    ndwi_stats = index_image.reduceRegion({
-                        'reducer': ee.Reducer.mean(),
-                        'geometry': galicia,
-                        'scale': 1000,
-                        'maxPixels': 1e9
-                    }).getInfo()
+                    ndwi_stats = reduce_mean(index_image, galicia, period_stats)
                     
                     # Get the NDWI value and convert to 0-100 scale (water presence)
                     ndwi_value = ndwi_stats.get('NDWI', 0)
@@ -209,15 +251,10 @@ def main():
                 elif index['id'] == 'ndbi':
                     # NDBI - Normalized Difference Built-up Index
                     # (SWIR - NIR) / (SWIR + NIR)
-                    index_image = composite.normalizedDifference(['B11', 'B8']).rename('NDBI')
+                    index_image = composite.normalizedDifference(list(INDEX_BANDS['ndbi'])).rename('NDBI')
                     
                     # Calculate average NDBI across the region
-                    ndbi_stats = index_image.reduceRegion({
-                        'reducer': ee.Reducer.mean(),
-                        'geometry': galicia,
-                        'scale': 1000,
-                        'maxPixels': 1e9
-                    }).getInfo()
+                    ndbi_stats = reduce_mean(index_image, galicia, period_stats)
                     
                     # Get the NDBI value and convert to 0-100 scale (built-up area)
                     ndbi_value = ndbi_stats.get('NDBI', 0)
@@ -234,15 +271,10 @@ def main():
                 elif index['id'] == 'nbr':
                     # NBR - Normalized Burn Ratio
                     # (NIR - SWIR) / (NIR + SWIR)
-                    index_image = composite.normalizedDifference(['B8', 'B12']).rename('NBR')
+                    index_image = composite.normalizedDifference(list(INDEX_BANDS['nbr'])).rename('NBR')
                     
                     # Calculate average NBR across the region
-                    nbr_stats = index_image.reduceRegion({
-                        'reducer': ee.Reducer.mean(),
-                        'geometry': galicia,
-                        'scale': 1000,
-                        'maxPixels': 1e9
-                    }).getInfo()
+                    nbr_stats = reduce_mean(index_image, galicia, period_stats)
                     
                     # Get the NBR value and convert to 0-100 scale (burn detection)
                     nbr_value = nbr_stats.get('NBR', 0)
@@ -258,7 +290,7 @@ def main():
                     }
                 
                 # Get map ID for visualization
-                mapid = index_image.getMapId(index['vis_params'])
+                mapid = ee_client.get_map_id(index_image, index['vis_params'])
                 
                 # Add index data to the period
                 period_data['indices'].append({
@@ -1,18 +1,17 @@
 import ee
 import json
 import os
+import sys
 import numpy as np
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core import ee_client
+from core.sentinel_composites import get_composites, get_composite_periods, get_period_composite
+
 def main():
     # Authenticate and initialize Earth Engine
-    try:
-        ee.Initialize(project="ee-nikolaslafrentz")
-        print("Earth Engine initialized successfully")
-    except Exception as e:
-        print(f"Error initializing Earth Engine: {e}")
-        ee.Authenticate()
-        ee.Initialize(project="ee-nikolaslafrentz")
-        print("Earth Engine initialized after authentication")
+    ee_client.initialize(authenticate=True)
+    print("Earth Engine initialized successfully")
     
     # Define the Galicia region boundaries (approximate coordinates)
     galicia = ee.Geometry.Polygon([
@@ -22,21 +21,9 @@ def main():
          [-6.767578, 41.862611]]
     ])
     
-    # Define time periods (one month at a time for 2023)
-    time_periods = [
-        {'start': '2023-01-01', 'end': '2023-01-31', 'name': 'Jan 2023'},
-        {'start': '2023-02-01', 'end': '2023-02-28', 'name': 'Feb 2023'},
-        {'start': '2023-03-01', 'end': '2023-03-31', 'name': 'Mar 2023'},
-        {'start': '2023-04-01', 'end': '2023-04-30', 'name': 'Apr 2023'},
-        {'start': '2023-05-01', 'end': '2023-05-31', 'name': 'May 2023'},
-        {'start': '2023-06-01', 'end': '2023-06-30', 'name': 'Jun 2023'},
-        {'start': '2023-07-01', 'end': '2023-07-31', 'name': 'Jul 2023'},
-        {'start': '2023-08-01', 'end': '2023-08-31', 'name': 'Aug 2023'},
-        {'start': '2023-09-01', 'end': '2023-09-30', 'name': 'Sep 2023'},
-        {'start': '2023-10-01', 'end': '2023-10-31', 'name': 'Oct 2023'},
-        {'start': '2023-11-01', 'end': '2023-11-30', 'name': 'Nov 2023'},
-        {'start': '2023-12-01', 'end': '2023-12-31', 'name': 'Dec 2023'}
-    ]
+    # Monthly median composites for 2023, grouped on the server from a single
+    # filtered collection
+    composites = get_composites(galicia, '2023-01-01', '2023-12-31', period='month', cloud_max=30)
     
     # Define spectral indices with descriptions
     spectral_indices = [
@@ -80,17 +67,14 @@ def main():
         'periods': []
     }
     
+    # Fetch every period's name, dates and image count in one request
+    time_periods = get_composite_periods(composites)
+    
     # Process each time period
     for period in time_periods:
         print(f"Processing {period['name']}...")
         
-        # Get Sentinel-2 surface reflectance data for the period
-        sentinel = ee.ImageCollection('COPERNICUS/S2_SR') \
-            .filterBounds(galicia) \
-            .filterDate(period['start'], period['end']) \
-            .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 30))
-        
-        image_count = sentinel.size().getInfo()
+        image_count = period['imageCount']
         print(f"  Found {image_count} Sentinel-2 images")
         
         # Skip if no images found
@@ -98,8 +82,8 @@ def main():
             print(f"  No images found for {period['name']}, skipping")
             continue
         
-        # Create a median composite for this period
-        composite = sentinel.median()
+        # Median composite for this period
+        composite = get_period_composite(composites, period['start'])
         
         # Initialize period data
         period_data = {
@@ -184,7 +168,7 @@ def main():
                     }
                 
                 # Get map ID for visualization
-                mapid = index_image.getMapId(index['vis_params'])
+                mapid = ee_client.get_map_id(index_image, index['vis_params'])
                 
                 # Add index data to the period
                 period_data['indices'].append({
@@ -4,27 +4,30 @@ import cv2
 import os
 import json
 import logging
-import requests
-import tempfile
+import sys
+import math
+import gzip
+import io
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import shapely
 from shapely.geometry import Polygon, mapping
 import matplotlib.pyplot as plt
 import geojson
 from pyproj import Transformer
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core import ee_client, instrumentation
+from core.spectral_indices import INDEX_BANDS
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s', 
                    handlers=[logging.StreamHandler(), logging.FileHandler('geo_polygons_process.log')])
 
 def initialize_ee():
     """Initialize Google Earth Engine"""
-    try:
-        ee.Initialize(project="ee-nikolaslafrentz")
-        logging.info("Earth Engine initialized successfully")
-    except Exception as e:
-        logging.error(f"Error initializing Earth Engine: {e}")
-        ee.Authenticate()
-        ee.Initialize(project="ee-nikolaslafrentz")
-        logging.info("Earth Engine initialized after authentication")
+    ee_client.initialize(authenticate=True)
+    logging.info("Earth Engine initialized successfully")
 
 
 def get_satellite_image(coords, start_date, end_date, cloud_cover_max=30):
@@ -50,7 +53,7 @@ def get_satellite_image(coords, start_date, end_date, cloud_cover_max=30):
         .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', cloud_cover_max))
     
     # Count images
-    count = sentinel.size().getInfo()
+    count = ee_client.get_info(sentinel.size())
     logging.info(f"Found {count} Sentinel-2 images")
     
     if count == 0:
@@ -63,63 +66,200 @@ def get_satellite_image(coords, start_date, end_date, cloud_cover_max=30):
     return median
 
 
-def download_satellite_image(image, geometry, scale=10, vis_params=None):
+def download_satellite_image(image, geometry, scale=10, vis_params=None, dimensions=1024, save_path=None):
     """
-    Download a satellite image as a GeoTIFF file
+    Download a satellite image and decode it in memory
     
     Args:
         image: ee.Image object
         geometry: ee.Geometry defining the region
         scale: Resolution in meters per pixel
         vis_params: Visualization parameters (e.g., bands, min, max)
+        dimensions: Thumbnail size, either the longest side or "WIDTHxHEIGHT"
+        save_path: Optional path to also write the PNG to
         
     Returns:
-        str: Path to downloaded image
+        numpy.ndarray: BGR image, as returned by cv2.imread()
     """
     if vis_params is None:
         # Default to true color RGB
         vis_params = {'min': 0, 'max': 3000, 'bands': ['B4', 'B3', 'B2']}
     
     # Get a URL to download the image
-    url = image.visualize(**vis_params).getThumbURL({
+    url = ee_client.get_thumb_url(image.visualize(**vis_params), {
         'region': geometry,
-        'dimensions': 1024,
+        'dimensions': dimensions,
         'format': 'png'
     })
     
     # Download the image
-    response = requests.get(url)
+    response = ee_client.fetch_url(url)
     if response.status_code != 200:
         logging.error(f"Failed to download image: {response.status_code}")
         return None
     
-    # Save to a temporary file
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-    with open(temp_file.name, 'wb') as f:
-        f.write(response.content)
+    # Decode straight from the response buffer; nothing touches the disk
+    decoded = cv2.imdecode(np.frombuffer(response.content, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if decoded is None:
+        logging.error("Failed to decode downloaded image")
+        return None
+    
+    if save_path is not None:
+        with open(save_path, 'wb') as f:
+            f.write(response.content)
+        logging.info(f"Saved downloaded image to {save_path}")
+    
+    logging.info(f"Downloaded {decoded.shape[1]}x{decoded.shape[0]} image")
+    return decoded
+
+
+def _download_band_arrays(image, geometry, dimensions):
+    """
+    Fetch an integer image as one array per band
+    
+    The bands come as a deflated zip of single-band GeoTIFFs, decoded
+    losslessly, rather than as NPY, which Earth Engine sends uncompressed.
+    
+    Returns:
+        dict: Band name -> 2-D array, or None if the download failed
+    """
+    url = ee_client.get_download_url(image, {
+        'region': geometry,
+        'dimensions': dimensions,
+        'format': 'ZIPPED_GEO_TIFF_PER_BAND'
+    })
+    
+    response = ee_client.fetch_url(url)
+    if response.status_code != 200:
+        logging.error(f"Failed to download band values: {response.status_code}")
+        return None
+    
+    arrays = {}
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        for name in archive.namelist():
+            # Members are named <download id>.<band>.tif
+            band = name.rsplit('.', 2)[-2]
+            arrays[band] = cv2.imdecode(np.frombuffer(archive.read(name), np.uint8), cv2.IMREAD_UNCHANGED)
+    
+    height, width = next(iter(arrays.values())).shape
+    logging.info(f"Downloaded {width}x{height} values for {', '.join(arrays)} "
+                 f"({len(response.content) / 1e6:.1f} MB)")
+    return arrays
+
+
+# Bands fetched once per AOI and shared by every extractor: what RGB rendering
+# needs, plus the indices, which are computed server-side (so B8 isn't needed)
+SHARED_REFLECTANCE_BANDS = ['B2', 'B3', 'B4']
+SHARED_INDEX_BANDS = ['NDVI', 'NDWI']
+
+# Indices travel as int16 scaled by this factor, half the bytes of float32
+INDEX_SCALE = 10000
+NODATA = -32768
+
+
+def download_shared_bands(image, geometry, dimensions=1024):
+    """
+    Download reflectance and index bands for an AOI in a single request
+    
+    Reflectance (already integer-valued) and the indices scaled by
+    INDEX_SCALE are stacked into one int16 image, so RGB, NDVI and NDWI
+    extraction can all run against the same in-memory arrays.
+    
+    Args:
+        image: Sentinel-2 ee.Image (e.g. from get_satellite_image())
+        geometry: ee.Geometry defining the region
+        dimensions: Array size, either the longest side or "WIDTHxHEIGHT"
+        
+    Returns:
+        dict: Band name -> 2-D array (reflectance as-is, indices as float32
+        with NaN where masked), or None if the download failed
+    """
+    indices = [
+        image.normalizedDifference(list(INDEX_BANDS[band.lower()])).rename(band)
+        for band in SHARED_INDEX_BANDS
+    ]
+    stacked = image.select(SHARED_REFLECTANCE_BANDS) \
+        .addBands(ee.Image.cat(indices).multiply(INDEX_SCALE)) \
+        .unmask(NODATA) \
+        .toInt16()
+    
+    downloaded = _download_band_arrays(stacked, geometry, dimensions)
+    if downloaded is None:
+        return None
+    
+    arrays = {band: downloaded[band] for band in SHARED_REFLECTANCE_BANDS}
+    for band in SHARED_INDEX_BANDS:
+        values = downloaded[band].astype(np.float32)
+        values[downloaded[band] == NODATA] = np.nan
+        arrays[band] = values / INDEX_SCALE
+    return arrays
+
+
+def render_visualization(arrays, vis_params, default_band=None):
+    """
+    Render band arrays to a BGR image locally, like ee.Image.visualize()
+    
+    Args:
+        arrays: Dict of band name -> 2-D array
+        vis_params: Visualization parameters ('bands', 'min', 'max', 'palette')
+        default_band: Band used when vis_params has no 'bands'
+        
+    Returns:
+        numpy.ndarray: uint8 BGR image, as returned by cv2.imread()
+    """
+    bands = vis_params.get('bands', [default_band])
+    low = np.broadcast_to(np.asarray(vis_params.get('min', 0), dtype=np.float32), (len(bands),))
+    high = np.broadcast_to(np.asarray(vis_params.get('max', 1), dtype=np.float32), (len(bands),))
+    
+    stretched = [
+        np.clip((np.asarray(arrays[band], dtype=np.float32) - low[i]) / (high[i] - low[i]), 0, 1)
+        for i, band in enumerate(bands)
+    ]
     
-    logging.info(f"Downloaded image to {temp_file.name}")
-    return temp_file.name
+    if 'palette' in vis_params:
+        colors = np.array([[int(c.lstrip('#')[j:j + 2], 16) for j in (0, 2, 4)]
+                           for c in vis_params['palette']], dtype=np.float32)
+        # Linear interpolation between neighbouring palette entries
+        position = np.nan_to_num(stretched[0]) * (len(colors) - 1)
+        lower = np.floor(position).astype(int)
+        upper = np.minimum(lower + 1, len(colors) - 1)
+        fraction = (position - lower)[..., None]
+        rgb = colors[lower] * (1 - fraction) + colors[upper] * fraction
+        rgb[np.isnan(stretched[0])] = 0
+    else:
+        if len(stretched) == 1:
+            stretched = stretched * 3  # Grayscale
+        rgb = np.stack([np.nan_to_num(band) for band in stretched], axis=-1) * 255
+    
+    return np.ascontiguousarray(np.rint(rgb[..., ::-1]).astype(np.uint8))
 
 
-def image_to_polygons(image_path, threshold_min=100, threshold_max=200, min_area=100, save_contours=True):
+def image_to_polygons(image_path, threshold_min=100, threshold_max=200, min_area=100, save_contours=True,
+                      contours_path=None):
     """
     Extract polygons from an image using edge detection and contour finding
     
     Args:
-        image_path: Path to the image file
+        image_path: Path to the image file, or an already decoded BGR array
         threshold_min: Lower threshold for Canny edge detection
         threshold_max: Upper threshold for Canny edge detection
         min_area: Minimum contour area to consider
         save_contours: Whether to save an image showing the detected contours
+        contours_path: Where to save it; defaults to "<image>_contours.png"
+            next to an image file, and is required for in-memory images
         
     Returns:
         list: List of Shapely polygons
     """
+    in_memory = isinstance(image_path, np.ndarray)
+    if in_memory:
+        image = image_path
+        image_path = "<in-memory image>"
     logging.debug(f"Processing image: {image_path}")
     try:
         # Load image
-        image = cv2.imread(image_path)
+        if not in_memory:
+            image = cv2.imread(image_path)
         if image is None:
             logging.error(f"Failed to load image: {image_path}")
             return []
@@ -146,14 +286,15 @@ def image_to_polygons(image_path, threshold_min=100, threshold_max=200, min_area
         logging.info(f"Filtered to {len(filtered_contours)} contours with area > {min_area}")
         
         # Draw contours on the original image if requested
-        if save_contours:
+        if contours_path is None and not in_memory:
+            contours_path = f"{os.path.splitext(image_path)[0]}_contours.png"
+        if save_contours and contours_path is not None:
             image_with_contours = image.copy()
             cv2.drawContours(image_with_contours, filtered_contours, -1, (0, 255, 0), 2)
             
             # Save the image with contours
-            output_image_path = f"{os.path.splitext(image_path)[0]}_contours.png"
-            cv2.imwrite(output_image_path, image_with_contours)
-            logging.info(f"Image with contours saved to {output_image_path}")
+            cv2.imwrite(contours_path, image_with_contours)
+            logging.info(f"Image with contours saved to {contours_path}")
         
         # Convert contours to polygons (in pixel coordinates)
         pixel_polygons = []
@@ -180,6 +321,119 @@ def image_to_polygons(image_path, threshold_min=100, threshold_max=200, min_area
         return []
 
 
+def threshold_to_polygons(values, min_value=None, max_value=None, min_area=50, simplify=1.0):
+    """
+    Extract polygons of the pixels whose value lies within a range
+    
+    The mask is traced with a single connected-component contour pass, so
+    holes (e.g. islands in a water body) are kept as polygon interiors.
+    
+    Args:
+        values: 2-D array of raw index values (NaN for masked pixels)
+        min_value: Keep pixels above this value (None for no lower bound)
+        max_value: Keep pixels below this value (None for no upper bound)
+        min_area: Minimum polygon area in pixels
+        simplify: Douglas-Peucker tolerance in pixels (0 to keep every vertex)
+        
+    Returns:
+        list: Dictionaries in the same format as image_to_polygons()
+    """
+    mask = np.ones(values.shape, dtype=bool)
+    if min_value is not None:
+        mask &= values > min_value
+    if max_value is not None:
+        mask &= values < max_value
+    img_height, img_width = values.shape
+    
+    # RETR_CCOMP gives outer boundaries and, one level down, their holes
+    contours, hierarchy = cv2.findContours(mask.astype(np.uint8), cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return []
+    
+    def ring(contour):
+        if simplify:
+            contour = cv2.approxPolyDP(contour, simplify, True)
+        return contour.reshape(-1, 2)
+    
+    holes = {}
+    for i, (_, _, _, parent) in enumerate(hierarchy[0]):
+        if parent >= 0 and len(contours[i]) >= 3:
+            holes.setdefault(parent, []).append(ring(contours[i]))
+    
+    pixel_polygons = []
+    for i, (_, _, _, parent) in enumerate(hierarchy[0]):
+        if parent >= 0 or cv2.contourArea(contours[i]) <= min_area:
+            continue
+        shell = ring(contours[i])
+        if len(shell) < 3:
+            continue
+        interiors = [hole for hole in holes.get(i, []) if len(hole) >= 3]
+        polygon = Polygon(shell, interiors)
+        if not polygon.is_valid:
+            polygon = polygon.buffer(0)
+            if polygon.geom_type != 'Polygon':
+                continue
+        pixel_polygons.append({
+            'polygon': polygon,
+            'area': polygon.area,
+            'centroid': (polygon.centroid.x, polygon.centroid.y),
+            'img_dims': (img_width, img_height)
+        })
+    
+    logging.info(f"Created {len(pixel_polygons)} polygons from the value mask")
+    return pixel_polygons
+
+
+# Polygons transformed per vectorized batch when streaming geographic polygons
+GEO_BATCH_SIZE = 10000
+
+
+def iter_geo_coords(pixel_polygons, bounds, batch_size=GEO_BATCH_SIZE):
+    """
+    Convert pixel coordinates to geographic coordinates, yielding polygons as they are converted
+    
+    Polygons are transformed in batches of `batch_size`: all vertices of a
+    batch go through one affine transform as a single NumPy array, and the
+    results are rebuilt and validated with Shapely's vectorized functions.
+    Only one batch of geographic polygons is held in memory at a time.
+    
+    Args:
+        pixel_polygons: Iterable of dictionaries containing pixel polygons and metadata
+        bounds: Geographic bounds [west, south, east, north]
+        batch_size: Number of polygons converted per batch
+        
+    Yields:
+        shapely.Polygon: Valid polygons with geographic coordinates
+    """
+    west, south, east, north = bounds
+    
+    batch = []
+    for pixel_polygon in pixel_polygons:
+        batch.append(pixel_polygon)
+        if len(batch) < batch_size:
+            continue
+        yield from _batch_to_geo(batch, west, south, east, north)
+        batch = []
+    
+    if batch:
+        yield from _batch_to_geo(batch, west, south, east, north)
+
+
+def _batch_to_geo(pixel_polygons, west, south, east, north):
+    polygons = np.array([pp['polygon'] for pp in pixel_polygons], dtype=object)
+    img_dims = np.array([pp['img_dims'] for pp in pixel_polygons], dtype=float)
+    
+    # Every vertex of every polygon, with the index of the polygon it belongs to
+    coords, owner = shapely.get_coordinates(polygons, return_index=True)
+    
+    # Pixel -> (longitude, latitude); y is inverted in images (0 at top)
+    coords[:, 0] = west + coords[:, 0] * ((east - west) / img_dims[owner, 0])
+    coords[:, 1] = north - coords[:, 1] * ((north - south) / img_dims[owner, 1])
+    
+    geo_polygons = shapely.set_coordinates(polygons.copy(), coords)
+    return geo_polygons[shapely.is_valid(geo_polygons)]
+
+
 def pixels_to_geo_coords(pixel_polygons, bounds):
     """
     Convert pixel coordinates to geographic coordinates
@@ -191,60 +445,322 @@ def pixels_to_geo_coords(pixel_polygons, bounds):
     Returns:
         list: List of Shapely polygons with geographic coordinates
     """
+    return list(iter_geo_coords(pixel_polygons, bounds))
+
+
+# Largest side requested per tile; bigger AOIs are split into more tiles. The five
+# int16 shared bands of a full tile stay under Earth Engine's download size limit
+MAX_TILE_DIMENSION = 2048
+
+# Approximate metres per degree of latitude
+METERS_PER_DEGREE = 111320
+
+
+def plan_tile_grid(bounds, scale, max_dimension=MAX_TILE_DIMENSION):
+    """
+    Split bounds into a grid of tiles small enough to download at `scale`
+    
+    Args:
+        bounds: Geographic bounds [west, south, east, north]
+        scale: Target resolution in meters per pixel
+        max_dimension: Largest tile side in pixels
+        
+    Returns:
+        list: (tile bounds [west, south, east, north], (width, height) in pixels) per tile
+    """
     west, south, east, north = bounds
+    mid_lat = math.radians((south + north) / 2)
+    width_px = (east - west) * METERS_PER_DEGREE * math.cos(mid_lat) / scale
+    height_px = (north - south) * METERS_PER_DEGREE / scale
+    
+    cols = max(1, math.ceil(width_px / max_dimension))
+    rows = max(1, math.ceil(height_px / max_dimension))
+    tile_width = max(1, round(width_px / cols))
+    tile_height = max(1, round(height_px / rows))
+    
+    tiles = []
+    for row in range(rows):
+        for col in range(cols):
+            tile_bounds = [
+                west + (east - west) * col / cols,
+                north - (north - south) * (row + 1) / rows,
+                west + (east - west) * (col + 1) / cols,
+                north - (north - south) * row / rows
+            ]
+            tiles.append((tile_bounds, (tile_width, tile_height)))
+    return tiles
+
+
+def extract_tile_polygons(tile_image, tile_bounds, threshold_min, threshold_max, min_area):
+    """Run contour extraction for one downloaded tile (executed in a worker process)"""
+    pixel_polygons = image_to_polygons(tile_image, threshold_min=threshold_min,
+                                       threshold_max=threshold_max, min_area=min_area,
+                                       save_contours=False)
+    return pixels_to_geo_coords(pixel_polygons, tile_bounds)
+
+
+def connected_components(count, pairs):
+    """Label connected components of `count` nodes joined by an (n, 2) array of pairs"""
+    parent = np.arange(count)
+    
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    
+    for a, b in pairs:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+    
+    return np.array([find(i) for i in range(count)])
+
+
+def stitch_tile_seams(polygons, tile_ids, tiles, tolerance):
+    """
+    Merge polygons that were cut apart by internal tile edges
+    
+    Only polygons lying within `tolerance` of an internal seam are
+    considered, and only pairs from different tiles are joined, so
+    polygons inside a tile are left untouched.
     
-    geo_polygons = []
-    for pp in pixel_polygons:
-        polygon = pp['polygon']
-        img_width, img_height = pp['img_dims']
+    Args:
+        polygons: Shapely polygons from all tiles
+        tile_ids: Index of the tile each polygon came from
+        tiles: Tile list from plan_tile_grid()
+        tolerance: Seam snapping distance in degrees (about one pixel)
         
-        # Create a transformer function to convert from pixel to geo coordinates
-        def transform_point(x, y):
-            # Convert from pixel coordinates to 0-1 range
-            x_ratio = x / img_width
-            y_ratio = y / img_height
-            
-            # Convert to geographic coordinates (longitude, latitude)
-            lon = west + (east - west) * x_ratio
-            # Note: Y is inverted in images (0 at top)
-            lat = north - (north - south) * y_ratio
-            
-            return lon, lat
+    Returns:
+        list: Polygons with seam-crossing pieces merged
+    """
+    if not polygons:
+        return []
+    
+    polygons = np.array(polygons, dtype=object)
+    tile_ids = np.asarray(tile_ids)
+    
+    # Internal seams are the tile edges that aren't on the outer boundary
+    all_bounds = np.array([tile_bounds for tile_bounds, _ in tiles])
+    west, south = all_bounds[:, 0].min(), all_bounds[:, 1].min()
+    east, north = all_bounds[:, 2].max(), all_bounds[:, 3].max()
+    seam_xs = np.unique(all_bounds[:, 2][all_bounds[:, 2] < east])
+    seam_ys = np.unique(all_bounds[:, 3][all_bounds[:, 3] < north])
+    seams = [shapely.box(x - tolerance, south, x + tolerance, north) for x in seam_xs]
+    seams += [shapely.box(west, y - tolerance, east, y + tolerance) for y in seam_ys]
+    if not seams:
+        return list(polygons)
+    
+    tree = shapely.STRtree(polygons)
+    _, on_seam = tree.query(np.array(seams), predicate='intersects')
+    on_seam = np.unique(on_seam)
+    
+    candidates = shapely.buffer(polygons[on_seam], tolerance)
+    pairs = shapely.STRtree(candidates).query(candidates, predicate='intersects').T
+    pairs = pairs[tile_ids[on_seam[pairs[:, 0]]] != tile_ids[on_seam[pairs[:, 1]]]]
+    labels = connected_components(len(on_seam), pairs)
+    
+    stitched = [polygons[i] for i in np.setdiff1d(np.arange(len(polygons)), on_seam)]
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        if len(members) == 1:
+            stitched.append(polygons[on_seam[members[0]]])
+            continue
+        merged = shapely.buffer(shapely.union_all(candidates[members]), -tolerance)
+        stitched.extend(part for part in shapely.get_parts(merged) if part.is_valid and not part.is_empty)
+    
+    logging.info(f"Stitched {len(on_seam)} seam polygons into {len(stitched) - (len(polygons) - len(on_seam))}")
+    return stitched
+
+
+def extract_tiled_polygons(image, bounds, indices, scale=30, workers=None, max_dimension=MAX_TILE_DIMENSION):
+    """
+    Extract polygons at near-native resolution by processing the AOI as a grid of tiles
+    
+    Each tile's bands are downloaded once with download_shared_bands() and
+    every index is rendered from them locally, so a tile costs one request
+    however many indices are extracted. Tiles are downloaded concurrently,
+    each rendering is run through image_to_polygons() in a process pool,
+    and contours cut at tile edges are then stitched back together.
+    
+    Args:
+        image: Sentinel-2 ee.Image (e.g. from get_satellite_image())
+        bounds: Geographic bounds [west, south, east, north]
+        indices: Dict of index name -> (visualization parameters,
+            image_to_polygons() threshold_min/threshold_max/min_area settings)
+        scale: Target resolution in meters per pixel
+        workers: Worker processes (defaults to the CPU count)
+        max_dimension: Largest tile side in pixels
         
-        # Transform all polygon vertices
-        geo_coords = [transform_point(x, y) for x, y in polygon.exterior.coords]
+    Returns:
+        dict: Index name -> list of Shapely polygons with geographic coordinates
+    """
+    tiles = plan_tile_grid(bounds, scale, max_dimension)
+    logging.info(f"Extracting {len(tiles)} tiles at {scale} m/pixel")
+    
+    def download_tile(tile):
+        (west, south, east, north), (width, height) = tile
+        region = ee.Geometry.Rectangle([west, south, east, north])
+        return download_shared_bands(image, region, dimensions=f"{width}x{height}")
+    
+    polygons = {name: [] for name in indices}
+    tile_ids = {name: [] for name in indices}
+    with ThreadPoolExecutor(max_workers=8) as downloads, ProcessPoolExecutor(max_workers=workers) as extractors:
+        # Hand each tile's renderings to the process pool as soon as its download finishes
+        futures = []
+        for tile_id, (tile, tile_bands) in enumerate(zip(tiles, downloads.map(download_tile, tiles))):
+            if tile_bands is None:
+                continue
+            for name, (vis_params, thresholds) in indices.items():
+                tile_image = render_visualization(tile_bands, vis_params, name.upper())
+                futures.append((name, tile_id, extractors.submit(
+                    extract_tile_polygons, tile_image, tile[0], **thresholds
+                )))
         
-        # Create a new Shapely polygon with geographic coordinates
-        geo_polygon = Polygon(geo_coords)
-        if geo_polygon.is_valid:
-            geo_polygons.append(geo_polygon)
-    
-    return geo_polygons
+        for name, tile_id, future in futures:
+            tile_polygons = future.result()
+            polygons[name].extend(tile_polygons)
+            tile_ids[name].extend([tile_id] * len(tile_polygons))
+    
+    # About one pixel, so pieces on either side of a seam overlap when buffered
+    (west, _, east, _), (width, _) = tiles[0]
+    tolerance = (east - west) / width
+    return {name: stitch_tile_seams(polygons[name], tile_ids[name], tiles, tolerance) for name in indices}
+
+
+# File suffixes of newline-delimited GeoJSON (one feature per line)
+NEWLINE_DELIMITED_SUFFIXES = ('.geojsonl', '.ndjson')
+
+
+def _open_output(path, mode):
+    """Open a text file, transparently gzip-compressed when the name ends in .gz"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
 
 
-def save_polygons_to_geojson(polygons, output_file):
+def save_polygons_to_geojson(polygons, output_file, newline_delimited=None, properties=None):
     """
-    Save polygons to GeoJSON file
+    Stream polygons to a GeoJSON file
+    
+    Features are serialized and written one at a time as the iterable
+    produces them, so a generator such as iter_geo_coords() can be written
+    without ever holding all features in memory.
     
     Args:
-        polygons: List of Shapely polygons with geographic coordinates
-        output_file: Path to output GeoJSON file
+        polygons: Iterable of Shapely polygons with geographic coordinates
+        output_file: Path to output GeoJSON file; a .gz suffix gzips it
+        newline_delimited: Write one feature per line (GeoJSON Lines /
+            NDJSON) instead of a FeatureCollection; by default this follows
+            the file suffix (.geojsonl / .ndjson)
+        properties: Optional iterable of extra property dicts, one per polygon
+        
+    Returns:
+        int: Number of features written
     """
-    features = []
-    for i, polygon in enumerate(polygons):
-        feature = geojson.Feature(
-            id=i,
-            geometry=mapping(polygon),
-            properties={'id': i}
-        )
-        features.append(feature)
+    if newline_delimited is None:
+        newline_delimited = output_file.removesuffix('.gz').endswith(NEWLINE_DELIMITED_SUFFIXES)
+    
+    count = 0
+    with _open_output(output_file, 'w') as f:
+        if not newline_delimited:
+            f.write('{"type": "FeatureCollection", "features": [')
+        
+        extra_properties = iter(properties) if properties is not None else None
+        for i, polygon in enumerate(polygons):
+            feature_properties = {'id': i}
+            if extra_properties is not None:
+                feature_properties.update(next(extra_properties))
+            feature = geojson.dumps(geojson.Feature(
+                id=i,
+                geometry=mapping(polygon),
+                properties=feature_properties
+            ))
+            if newline_delimited:
+                f.write(feature + '\n')
+            else:
+                f.write(feature if i == 0 else ', ' + feature)
+            count += 1
+        
+        if not newline_delimited:
+            f.write(']}')
     
-    feature_collection = geojson.FeatureCollection(features)
+    logging.info(f"Saved {count} polygons to {output_file}")
+    return count
+
+
+def load_geojson_features(geojson_file):
+    """Yield the features of a file written by save_polygons_to_geojson(), in any of its formats"""
+    with _open_output(geojson_file, 'r') as f:
+        if geojson_file.removesuffix('.gz').endswith(NEWLINE_DELIMITED_SUFFIXES):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)['features']
+
+
+def merge_index_layers(layers, iou_threshold=0.5):
+    """
+    Merge near-duplicate polygons detected by different indices into one layer
     
-    with open(output_file, 'w') as f:
-        geojson.dump(feature_collection, f)
+    Candidate pairs come from a single STRtree query over every polygon, so
+    only bounding-box neighbours are compared. Pairs from different indices
+    whose intersection over union reaches `iou_threshold` are grouped
+    transitively and each group is replaced by the union of its members.
     
-    logging.info(f"Saved {len(polygons)} polygons to {output_file}")
+    Args:
+        layers: Dict of index name -> list of Shapely polygons
+        iou_threshold: Minimum IoU for two polygons to count as the same feature
+        
+    Returns:
+        tuple: (list of polygons, list of sorted index-name lists that detected each one)
+    """
+    names = list(layers)
+    polygons = np.array([polygon for name in names for polygon in layers[name]], dtype=object)
+    sources = np.repeat(np.arange(len(names)), [len(layers[name]) for name in names])
+    if len(polygons) == 0:
+        return [], []
+    
+    left, right = shapely.STRtree(polygons).query(polygons, predicate='intersects')
+    cross_index = (left < right) & (sources[left] != sources[right])
+    left, right = left[cross_index], right[cross_index]
+    
+    iou = (shapely.area(shapely.intersection(polygons[left], polygons[right]))
+           / shapely.area(shapely.union(polygons[left], polygons[right])))
+    duplicates = np.column_stack([left, right])[iou >= iou_threshold]
+    labels = connected_components(len(polygons), duplicates)
+    
+    merged = []
+    detected_by = []
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        if len(members) == 1:
+            merged.append(polygons[members[0]])
+        else:
+            merged.append(shapely.union_all(polygons[members]))
+        detected_by.append(sorted({names[source] for source in sources[members]}))
+    
+    logging.info(f"Merged {len(polygons)} polygons from {len(names)} indices into {len(merged)}")
+    return merged, detected_by
+
+
+def merge_polygon_files(index_files, output_file, iou_threshold=0.5):
+    """
+    Merge per-index polygon files into one layer tagged with the detecting indices
+    
+    Args:
+        index_files: Dict of index name -> polygon file written by save_polygons_to_geojson()
+        output_file: Path of the merged polygon file
+        iou_threshold: Minimum IoU for two polygons to count as the same feature
+    """
+    layers = {
+        name: [shapely.geometry.shape(feature['geometry']) for feature in load_geojson_features(path)]
+        for name, path in index_files.items()
+    }
+    merged, detected_by = merge_index_layers(layers, iou_threshold)
+    save_polygons_to_geojson(merged, output_file,
+                             properties=({'indices': indices} for indices in detected_by))
 
 
 def visualize_results(original_image_path, geojson_file, output_image_path):
@@ -252,12 +768,15 @@ def visualize_results(original_image_path, geojson_file, output_image_path):
     Create a visualization of the extracted polygons on the original image
     
     Args:
-        original_image_path: Path to the original satellite image
+        original_image_path: Path to the original satellite image, or the decoded BGR array
         geojson_file: Path to the GeoJSON file containing polygons
         output_image_path: Path to save the visualization
     """
     # Load original image
-    img = plt.imread(original_image_path)
+    if isinstance(original_image_path, np.ndarray):
+        img = cv2.cvtColor(original_image_path, cv2.COLOR_BGR2RGB)
+    else:
+        img = plt.imread(original_image_path)
     
     # Create figure and axis
     fig, ax = plt.subplots(figsize=(10, 10))
@@ -265,12 +784,8 @@ def visualize_results(original_image_path, geojson_file, output_image_path):
     # Display the original image
     ax.imshow(img)
     
-    # Load GeoJSON data
-    with open(geojson_file, 'r') as f:
-        data = geojson.load(f)
-    
     # Display each polygon with a random color
-    for feature in data['features']:
+    for feature in load_geojson_features(geojson_file):
         polygon = feature['geometry']['coordinates'][0]
         xs, ys = zip(*polygon)
         ax.plot(xs, ys, '-', linewidth=2, alpha=0.7)
@@ -285,7 +800,15 @@ def visualize_results(original_image_path, geojson_file, output_image_path):
     logging.info(f"Visualization saved to {output_image_path}")
 
 
-def main(coords, start_date, end_date, output_dir="output"):
+# Raw value ranges (min, max) used for threshold extraction, e.g. NDWI > 0.2 for water
+DEFAULT_VALUE_THRESHOLDS = {
+    'ndvi': (0.4, None),
+    'ndwi': (0.2, None)
+}
+
+
+def main(coords, start_date, end_date, output_dir="output", tile_scale=None, workers=None,
+         output_format="geojson", merge_iou=0.5, keep_images=False, value_thresholds=None):
     """
     Main function to process satellite imagery and extract polygons
     
@@ -294,7 +817,30 @@ def main(coords, start_date, end_date, output_dir="output"):
         start_date: Start date for imagery (YYYY-MM-DD)
         end_date: End date for imagery (YYYY-MM-DD)
         output_dir: Directory to save output files
+        tile_scale: If set, extract from tiles at this resolution (m/pixel)
+            instead of a single 1024 px download shared by all indices
+        workers: Worker processes for tiled extraction
+        output_format: Polygon file suffix: "geojson", "geojsonl" (one
+            feature per line), optionally followed by ".gz"
+        merge_iou: IoU at which polygons from different indices are merged
+        keep_images: Also save each downloaded image to output_dir
+        value_thresholds: Dict of index name -> (min, max) raw value range,
+            e.g. DEFAULT_VALUE_THRESHOLDS. Listed indices are polygonized
+            from downloaded float values instead of edge detection on the
+            rendered image. Only 'ndvi' and 'ndwi' can be listed, and only
+            without tile_scale
     """
+    # Threshold extraction runs on the single shared download; tiles only
+    # go through edge detection, so the two can't be combined
+    if tile_scale is not None and value_thresholds:
+        raise ValueError("value_thresholds cannot be combined with tile_scale: threshold extraction "
+                         "only runs on the single shared download")
+    # Only the downloaded index bands hold raw values to threshold
+    unknown = set(value_thresholds or ()) - {band.lower() for band in SHARED_INDEX_BANDS}
+    if unknown:
+        raise ValueError(f"value_thresholds only supports {', '.join(band.lower() for band in SHARED_INDEX_BANDS)}, "
+                         f"not {', '.join(sorted(unknown))}")
+
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
     
@@ -305,7 +851,7 @@ def main(coords, start_date, end_date, output_dir="output"):
     geometry = ee.Geometry.Polygon([coords])
     
     # Get geographic bounds
-    bounds_dict = geometry.bounds().getInfo()['coordinates'][0]
+    bounds_dict = ee_client.get_info(geometry.bounds())['coordinates'][0]
     west = min(p[0] for p in bounds_dict)
     east = max(p[0] for p in bounds_dict)
     south = min(p[1] for p in bounds_dict)
@@ -339,39 +885,75 @@ def main(coords, start_date, end_date, output_dir="output"):
         }
     ]
     
+    # Edge detection settings per index; calculated indices use lower thresholds
+    thresholds_by_index = {
+        index['name']: ({'threshold_min': 100, 'threshold_max': 200, 'min_area': 100} if index['name'] == 'rgb'
+                        else {'threshold_min': 50, 'threshold_max': 150, 'min_area': 50})
+        for index in indices
+    }
+    
+    index_files = {}
+    shared_bands = None
+    tiled_polygons = None
     for index in indices:
         logging.info(f"Processing {index['name']} - {index['description']}")
+        thresholds = thresholds_by_index[index['name']]
+        output_file = os.path.join(output_dir, f"{index['name']}_polygons.{output_format}")
         
-        # Apply appropriate calculation for indices
-        if index['name'] == 'ndvi':
-            index_image = image.normalizedDifference(['B8', 'B4']).rename('NDVI')
-        elif index['name'] == 'ndwi':
-            index_image = image.normalizedDifference(['B3', 'B8']).rename('NDWI')
-        else:  # RGB
-            index_image = image
-        
-        # Download the image
-        image_path = download_satellite_image(index_image, geometry, vis_params=index['vis_params'])
-        if image_path is None:
+        if tile_scale is not None:
+            # All indices are extracted in one pass over the tiles, sharing each tile's download
+            if tiled_polygons is None:
+                with instrumentation.span('stage', 'extract tiles'):
+                    tiled_polygons = extract_tiled_polygons(
+                        image, bounds,
+                        {i['name']: (i['vis_params'], thresholds_by_index[i['name']]) for i in indices},
+                        scale=tile_scale, workers=workers
+                    )
+            # Tiled extraction has no single image to draw the results over
+            save_polygons_to_geojson(tiled_polygons[index['name']], output_file)
+            index_files[index['name']] = output_file
             continue
         
-        # Extract polygons (in pixel coordinates)
-        # Adjust thresholds based on the index
-        if index['name'] == 'rgb':
-            pixel_polygons = image_to_polygons(image_path, threshold_min=100, threshold_max=200, min_area=100)
-        else:  # For calculated indices, use different thresholds
-            pixel_polygons = image_to_polygons(image_path, threshold_min=50, threshold_max=150, min_area=50)
+        # Every index is extracted from the same download
+        if shared_bands is None:
+            with instrumentation.span('stage', 'download shared bands'):
+                shared_bands = download_shared_bands(image, geometry)
+            if shared_bands is None:
+                break
         
-        # Convert to geographic coordinates
-        geo_polygons = pixels_to_geo_coords(pixel_polygons, bounds)
+        if value_thresholds and index['name'] in value_thresholds:
+            min_value, max_value = value_thresholds[index['name']]
+            with instrumentation.span('stage', f"extract {index['name']} (threshold)"):
+                pixel_polygons = threshold_to_polygons(shared_bands[index['name'].upper()], min_value, max_value,
+                                                       min_area=thresholds['min_area'])
+                save_polygons_to_geojson(iter_geo_coords(pixel_polygons, bounds), output_file)
+            index_files[index['name']] = output_file
+            continue
         
-        # Save as GeoJSON
-        output_file = os.path.join(output_dir, f"{index['name']}_polygons.geojson")
-        save_polygons_to_geojson(geo_polygons, output_file)
+        # Render the index locally with the same visualization Earth Engine would apply
+        index_array = render_visualization(shared_bands, index['vis_params'], index['name'].upper())
+        if keep_images:
+            cv2.imwrite(os.path.join(output_dir, f"{index['name']}_image.png"), index_array)
+        
+        # Extract polygons (in pixel coordinates)
+        contours_path = os.path.join(output_dir, f"{index['name']}_contours.png")
+        with instrumentation.span('stage', f"extract {index['name']}"):
+            pixel_polygons = image_to_polygons(index_array, contours_path=contours_path, **thresholds)
+            
+            # Convert to geographic coordinates, streaming them straight into the file
+            save_polygons_to_geojson(iter_geo_coords(pixel_polygons, bounds), output_file)
+        index_files[index['name']] = output_file
         
         # Create visualization
         viz_file = os.path.join(output_dir, f"{index['name']}_visualization.png")
-        visualize_results(image_path, output_file, viz_file)
+        with instrumentation.span('stage', f"visualize {index['name']}"):
+            visualize_results(index_array, output_file, viz_file)
+    
+    # Combine the overlapping per-index layers into one tagged layer for the map
+    if index_files:
+        with instrumentation.span('stage', 'merge layers'):
+            merge_polygon_files(index_files, os.path.join(output_dir, f"merged_polygons.{output_format}"),
+                                iou_threshold=merge_iou)
     
     logging.info("Processing complete!")
 
@@ -386,5 +968,8 @@ if __name__ == "__main__":
         [-6.767578, 41.862611]   # Southeast
     ]
     
+    # Print per-stage and per-call timings at exit and keep a JSON trace of the run
+    instrumentation.enable(os.path.join("geo_polygons", "trace.json"))
+    
     # You can replace this with your own coordinates and date range
     main(galicia_coords, "2023-06-01", "2023-06-30", output_dir="geo_polygons")
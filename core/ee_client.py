@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import ee
+import requests
+
+try:
+    from core import instrumentation
+except ImportError:
+    import instrumentation
+
+PROJECT_ID = "ee-nikolaslafrentz"
+
+LIVE = 'live'
+RECORD = 'record'
+REPLAY = 'replay'
+
+DEFAULT_CASSETTE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'ee_cassette'
+)
+
+# Blocking Earth Engine calls go through this module so a whole pipeline can be
+# recorded once against the live API and replayed offline. The mode can also
+# be picked with PODARIA_EE_MODE / PODARIA_EE_CASSETTE / PODARIA_EE_LATENCY.
+_config = {
+    'mode': os.environ.get('PODARIA_EE_MODE', LIVE),
+    'cassette': os.environ.get('PODARIA_EE_CASSETTE', DEFAULT_CASSETTE),
+    'latency': os.environ.get('PODARIA_EE_LATENCY', '0')
+}
+_responses = None
+_lock = threading.Lock()
+
+class ReplayError(RuntimeError):
+    """Replay mode could not start; raised instead of falling back to interactive authentication"""
+
+def configure(mode=LIVE, cassette=DEFAULT_CASSETTE, latency=0.0):
+    """
+    Select how Earth Engine calls are served
+
+    Args:
+        mode: 'live' (plain API calls), 'record' (live calls saved to the
+            cassette) or 'replay' (responses served from the cassette)
+        cassette: Directory holding the recorded responses and payloads
+        latency: Seconds to sleep per replayed call, or 'recorded' to
+            reproduce the wall time measured while recording
+    """
+    global _responses
+    if mode not in (LIVE, RECORD, REPLAY):
+        raise ValueError(f"Unknown Earth Engine client mode: {mode}")
+    _config.update(mode=mode, cassette=cassette, latency=latency)
+    _responses = None
+
+def get_mode():
+    """Return the active mode ('live', 'record' or 'replay')"""
+    return _config['mode']
+
+def _cassette_path(*parts):
+    return os.path.join(_config['cassette'], *parts)
+
+def _load_responses():
+    global _responses
+    if _responses is None:
+        _responses = {}
+        path = _cassette_path('responses.jsonl')
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    _responses[entry['key']] = entry
+    return _responses
+
+def _serialize(obj):
+    return obj.serialize() if hasattr(obj, 'serialize') else str(obj)
+
+def _make_key(kind, obj, params=None, serialized=None):
+    serialized = _serialize(obj) if serialized is None else serialized
+    payload = json.dumps([kind, serialized, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _record(key, kind, value=None, error=None, elapsed=0.0):
+    entry = {'key': key, 'kind': kind, 'value': value, 'error': error, 'elapsed': elapsed}
+    with _lock:
+        os.makedirs(_config['cassette'], exist_ok=True)
+        with open(_cassette_path('responses.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+        _load_responses()[key] = entry
+
+def _replay(key, kind):
+    entry = _load_responses().get(key)
+    if entry is None:
+        raise ee.EEException(
+            f"No recorded {kind} response in {_config['cassette']}; re-run the pipeline in record mode"
+        )
+
+    latency = _config['latency']
+    delay = entry['elapsed'] if latency == 'recorded' else float(latency)
+    if delay:
+        time.sleep(delay)
+
+    if entry['error'] is not None:
+        raise ee.EEException(entry['error'])
+    return entry['value']
+
+def _call(kind, obj, params, live_call, to_json=lambda value: value):
+    """Run one blocking call according to the active mode"""
+    with instrumentation.span('ee', kind, mode=_config['mode']) as call:
+        # Payload is the serialized request graph plus the JSON response
+        serialized = _serialize(obj)
+        value = _run_call(kind, obj, params, live_call, to_json, serialized)
+        call.add_bytes(len(serialized) + len(json.dumps([params, value], default=str)))
+        return value
+
+def _run_call(kind, obj, params, live_call, to_json, serialized):
+    key = _make_key(kind, obj, params, serialized)
+    mode = _config['mode']
+    if mode == REPLAY:
+        return _replay(key, kind)
+    if mode == LIVE:
+        return to_json(live_call())
+
+    started = time.perf_counter()
+    try:
+        value = to_json(live_call())
+    except ee.EEException as e:
+        _record(key, kind, error=str(e), elapsed=time.perf_counter() - started)
+        raise
+    _record(key, kind, value=value, elapsed=time.perf_counter() - started)
+    return value
+
+def initialize(project=PROJECT_ID, authenticate=False):
+    """
+    Initialize Earth Engine for the active mode; replay needs no network or credentials
+
+    With authenticate=True, a failed live or record initialization runs
+    ee.Authenticate() and retries once. Replay never authenticates, since
+    that can't fix a missing or stale cassette: it raises ReplayError.
+    """
+    with instrumentation.span('ee', 'initialize', mode=_config['mode']):
+        try:
+            _initialize(project)
+        except Exception as e:
+            if not authenticate or _config['mode'] == REPLAY:
+                raise
+            print(f"Error initializing Earth Engine: {e}; authenticating")
+            ee.Authenticate()
+            _initialize(project)
+
+def _initialize(project):
+    algorithms_path = _cassette_path('algorithms.json')
+
+    if _config['mode'] == REPLAY:
+        try:
+            with open(algorithms_path, encoding='utf-8') as f:
+                algorithms = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ReplayError(f"Cannot read recorded algorithms from {algorithms_path}: {e}; "
+                              f"re-run the pipeline in record mode") from e
+
+        # Build the client-side API from the recorded algorithm signatures
+        # instead of the discovery document and algorithm list online. This
+        # stubs a private earthengine-api hook, so check it still exists.
+        if not hasattr(ee.data, '_install_cloud_api_resource'):
+            raise ReplayError(
+                f"earthengine-api {getattr(ee, '__version__', '?')} has no ee.data._install_cloud_api_resource; "
+                f"replay mode needs updating for this version"
+            )
+        original = (ee.data.getAlgorithms, ee.data._install_cloud_api_resource)
+        ee.data.getAlgorithms = lambda: algorithms
+        ee.data._install_cloud_api_resource = lambda: None
+        try:
+            ee.Initialize(credentials=None, project=project)
+        except Exception as e:
+            raise ReplayError(f"Earth Engine failed to initialize from the cassette: {e}") from e
+        finally:
+            ee.data.getAlgorithms, ee.data._install_cloud_api_resource = original
+        return
+
+    ee.Initialize(project=project)
+
+    if _config['mode'] == RECORD:
+        os.makedirs(_config['cassette'], exist_ok=True)
+        with open(algorithms_path, 'w', encoding='utf-8') as f:
+            json.dump(ee.data.getAlgorithms(), f)
+
+def get_info(obj):
+    """obj.getInfo() through the record/replay layer"""
+    return _call('getInfo', obj, None, obj.getInfo)
+
+def get_map_id(image, vis_params=None):
+    """image.getMapId() returning a dict with 'mapid', 'token' and 'tile_fetcher'"""
+    value = _call(
+        'getMapId', image, vis_params,
+        lambda: image.getMapId(vis_params),
+        lambda map_id: {
+            'mapid': map_id['mapid'],
+            'token': map_id['token'],
+            'url_format': map_id['tile_fetcher'].url_format
+        }
+    )
+    return {
+        'mapid': value['mapid'],
+        'token': value['token'],
+        'tile_fetcher': SimpleNamespace(url_format=value['url_format'])
+    }
+
+def get_thumb_url(image, params):
+    """image.getThumbURL() through the record/replay layer"""
+    return _call('getThumbURL', image, params, lambda: image.getThumbURL(params))
+
+def get_download_url(image, params):
+    """image.getDownloadURL() through the record/replay layer"""
+    return _call('getDownloadURL', image, params, lambda: image.getDownloadURL(params))
+
+def fetch_url(url, timeout=300):
+    """
+    Download an Earth Engine URL (thumbnail, download) through the record/replay layer
+
+    Returns:
+        SimpleNamespace: With `status_code` and `content`, like a requests.Response
+    """
+    with instrumentation.span('ee', 'fetch', mode=_config['mode']) as call:
+        response = _fetch_url(url, timeout)
+        call.add_bytes(len(response.content))
+        return response
+
+def _fetch_url(url, timeout):
+    key = _make_key('fetch', url)
+    mode = _config['mode']
+
+    if mode == REPLAY:
+        value = _replay(key, 'fetch')
+        with open(_cassette_path('payloads', value['payload']), 'rb') as f:
+            return SimpleNamespace(status_code=value['status_code'], content=f.read())
+
+    started = time.perf_counter()
+    response = requests.get(url, timeout=timeout)
+    if mode == RECORD:
+        payload = hashlib.sha256(response.content).hexdigest()
+        os.makedirs(_cassette_path('payloads'), exist_ok=True)
+        payload_path = _cassette_path('payloads', payload)
+        if not os.path.exists(payload_path):
+            with open(payload_path, 'wb') as f:
+                f.write(response.content)
+        _record(key, 'fetch', value={'status_code': response.status_code, 'payload': payload},
+                elapsed=time.perf_counter() - started)
+
+    return SimpleNamespace(status_code=response.status_code, content=response.content)
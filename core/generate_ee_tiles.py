@@ -2,42 +2,84 @@ import ee
 import json
 import os
 
+try:
+    from core import ee_client, instrumentation, tile_url_cache
+    from core.spectral_indices import INDEX_BANDS
+except ImportError:
+    import ee_client
+    import instrumentation
+    import tile_url_cache
+    from spectral_indices import INDEX_BANDS
+
+# Galicia bounding box as (west, south, east, north)
+GALICIA_BBOX = (-9.301758, 41.862611, -6.767578, 43.789203)
+
+# Collection settings shared by every tile request (and part of the cache key)
+SENTINEL_COLLECTION = 'COPERNICUS/S2_SR'
+MAX_CLOUD_PERCENTAGE = 20
+
+RGB_VIS = {
+    'min': 0,
+    'max': 3000,
+    'bands': ['B4', 'B3', 'B2']
+}
+
+NDVI_VIS = {
+    'min': -0.2,
+    'max': 0.8,
+    'palette': ['#d73027', '#f46d43', '#fdae61', '#fee08b', '#d9ef8b', '#a6d96a', '#66bd63', '#1a9850']
+}
+
+NDWI_VIS = {
+    'min': -0.5,
+    'max': 0.5,
+    'palette': ['#a52a2a', '#fcf8e3', '#86c4ec', '#0d47a1']
+}
+
+# Server-side expression behind each index, used to key the tile URL cache
+INDEX_EXPRESSIONS = {
+    'rgb': 'median()',
+    'ndvi': f"median().normalizedDifference({list(INDEX_BANDS['ndvi'])})",
+    'ndwi': f"median().normalizedDifference({list(INDEX_BANDS['ndwi'])})"
+}
+
+INDEX_VIS_PARAMS = {
+    'rgb': RGB_VIS,
+    'ndvi': NDVI_VIS,
+    'ndwi': NDWI_VIS
+}
+
 def authenticate_and_initialize():
     """Authenticate with Earth Engine and initialize"""
+    with instrumentation.span('stage', 'authenticate'):
+        return _authenticate_and_initialize()
+
+def _authenticate_and_initialize():
     try:
-        # Check if already authenticated
-        ee.Initialize(project="ee-nikolaslafrentz")
-        print("Earth Engine already authenticated and initialized!")
+        # Authenticates only if initializing with the stored credentials fails
+        ee_client.initialize(authenticate=True)
+        print("Earth Engine initialized successfully!")
         return True
-    except Exception:
-        try:
-            # Authenticate
-            ee.Authenticate()
-            # Initialize
-            ee.Initialize(project="ee-nikolaslafrentz")
-            print("Earth Engine authenticated and initialized successfully!")
-            return True
-        except Exception as e:
-            print(f"Error authenticating: {e}")
-            return False
+    except Exception as e:
+        print(f"Error initializing Earth Engine: {e}")
+        return False
 
 def get_galicia_geometry():
     """Define the Galicia region geometry"""
+    west, south, east, north = GALICIA_BBOX
     return ee.Geometry.Polygon([
-        [[-9.301758, 41.862611],
-         [-9.301758, 43.789203],
-         [-6.767578, 43.789203],
-         [-6.767578, 41.862611]]
+        [[west, south],
+         [west, north],
+         [east, north],
+         [east, south]]
     ])
 
 def get_sentinel_collection(start_date, end_date, region):
     """Get Sentinel-2 surface reflectance data for the region"""
-    sentinel = ee.ImageCollection('COPERNICUS/S2_SR') \
+    sentinel = ee.ImageCollection(SENTINEL_COLLECTION) \
         .filterBounds(region) \
         .filterDate(start_date, end_date) \
-        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 20))
-        
-    print(f"Found {sentinel.size().getInfo()} Sentinel-2 images for the specified time period.")
+        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', MAX_CLOUD_PERCENTAGE))
     return sentinel
 
 def create_composite(collection):
@@ -46,50 +88,54 @@ def create_composite(collection):
 
 def generate_rgb_url(image, region):
     """Generate a tile URL for RGB visualization"""
-    rgb_vis = {
-        'min': 0,
-        'max': 3000,
-        'bands': ['B4', 'B3', 'B2']
-    }
-    map_id = image.getMapId(rgb_vis)
+    map_id = ee_client.get_map_id(image, RGB_VIS)
     return map_id['tile_fetcher'].url_format
 
 def generate_ndvi_url(image, region):
     """Generate a tile URL for NDVI visualization"""
     # Calculate NDVI
-    ndvi = image.normalizedDifference(['B8', 'B4']).rename('NDVI')
-    
-    ndvi_vis = {
-        'min': -0.2,
-        'max': 0.8,
-        'palette': ['#d73027', '#f46d43', '#fdae61', '#fee08b', '#d9ef8b', '#a6d96a', '#66bd63', '#1a9850']
-    }
-    
-    map_id = ndvi.getMapId(ndvi_vis)
+    ndvi = image.normalizedDifference(list(INDEX_BANDS['ndvi'])).rename('NDVI')
+    map_id = ee_client.get_map_id(ndvi, NDVI_VIS)
     return map_id['tile_fetcher'].url_format
 
 def generate_ndwi_url(image, region):
     """Generate a tile URL for NDWI visualization"""
     # Calculate NDWI
-    ndwi = image.normalizedDifference(['B3', 'B8']).rename('NDWI')
+    ndwi = image.normalizedDifference(list(INDEX_BANDS['ndwi'])).rename('NDWI')
+    map_id = ee_client.get_map_id(ndwi, NDWI_VIS)
+    return map_id['tile_fetcher'].url_format
+
+def generate_period_indices(period, galicia):
+    """Query Earth Engine for one period and return (image_count, {index_id: tile_url})"""
+    # Get Sentinel data for this period
+    collection = get_sentinel_collection(period["start"], period["end"], galicia)
+    image_count = ee_client.get_info(collection.size())
+    print(f"Found {image_count} Sentinel-2 images for the specified time period.")
     
-    ndwi_vis = {
-        'min': -0.5,
-        'max': 0.5,
-        'palette': ['#a52a2a', '#fcf8e3', '#86c4ec', '#0d47a1']
-    }
+    if image_count == 0:
+        return 0, {}
     
-    map_id = ndwi.getMapId(ndwi_vis)
-    return map_id['tile_fetcher'].url_format
+    # Create composite image
+    composite = create_composite(collection)
+    
+    # Generate tile URLs for different indices
+    return image_count, {
+        "rgb": generate_rgb_url(composite, galicia),
+        "ndvi": generate_ndvi_url(composite, galicia),
+        "ndwi": generate_ndwi_url(composite, galicia)
+    }
 
-def generate_tile_urls():
+def generate_tile_urls(cache_path=tile_url_cache.DEFAULT_CACHE_PATH,
+                       max_age=tile_url_cache.DEFAULT_MAX_AGE_SECONDS):
     """Generate all tile URLs and save to JSON"""
-    # Authenticate and initialize
-    if not authenticate_and_initialize():
-        return False
+    # Tile URLs that are still valid come from the cache, so Earth Engine is
+    # only initialized once a period actually needs a fresh map ID
+    cache = tile_url_cache.open_cache(cache_path)
+    evicted = tile_url_cache.evict_expired(cache)
+    if evicted:
+        print(f"Evicted {evicted} expired tile URLs from the cache")
     
-    # Get the Galicia region
-    galicia = get_galicia_geometry()
+    galicia = None
     
     # Define time periods
     periods = [
@@ -120,43 +166,70 @@ def generate_tile_urls():
         "periods": []
     }
     
-    # For each time period, generate tile URLs
-    for period in periods:
-        print(f"\nProcessing period: {period['name']}")
+    try:
+        # For each time period, generate tile URLs
+        for period in periods:
+            print(f"\nProcessing period: {period['name']}")
         
-        # Get Sentinel data for this period
-        collection = get_sentinel_collection(period["start"], period["end"], galicia)
+            cache_keys = {
+                index_id: tile_url_cache.make_cache_key(
+                    SENTINEL_COLLECTION, period["start"], period["end"], MAX_CLOUD_PERCENTAGE,
+                    INDEX_EXPRESSIONS[index_id], INDEX_VIS_PARAMS[index_id]
+                )
+                for index_id in INDEX_EXPRESSIONS
+            }
+            cached = {
+                index_id: tile_url_cache.get_cached_tile(cache, key)
+                for index_id, key in cache_keys.items()
+            }
         
-        if collection.size().getInfo() > 0:
-            # Create composite image
-            composite = create_composite(collection)
+            if all(entry is not None for entry in cached.values()):
+                image_count = next(iter(cached.values()))[1]
+                tile_urls = {index_id: entry[0] for index_id, entry in cached.items()}
+                print(f"Using cached tile URLs for {period['name']}")
+            else:
+                if galicia is None:
+                    # Authenticate and initialize
+                    if not authenticate_and_initialize():
+                        return False
+                
+                    # Get the Galicia region
+                    galicia = get_galicia_geometry()
             
-            # Generate tile URLs for different indices
-            period_data = {
-                "name": period["name"],
-                "start": period["start"],
-                "end": period["end"],
-                "imageCount": collection.size().getInfo(),
-                "indices": [
-                    {
-                        "id": "rgb",
-                        "tileUrl": generate_rgb_url(composite, galicia)
-                    },
-                    {
-                        "id": "ndvi",
-                        "tileUrl": generate_ndvi_url(composite, galicia)
-                    },
-                    {
-                        "id": "ndwi",
-                        "tileUrl": generate_ndwi_url(composite, galicia)
-                    }
-                ]
-            }
+                image_count, tile_urls = generate_period_indices(period, galicia)
+                # Empty periods are cached too (with no URL), so they aren't
+                # queried again on every launch until the entry expires
+                for index_id in INDEX_EXPRESSIONS:
+                    tile_url_cache.store_tile(
+                        cache, cache_keys[index_id], SENTINEL_COLLECTION, period["start"], period["end"],
+                        MAX_CLOUD_PERCENTAGE, INDEX_EXPRESSIONS[index_id], INDEX_VIS_PARAMS[index_id],
+                        tile_urls.get(index_id, ''), image_count, max_age=max_age
+                    )
+        
+            if image_count > 0:
+                period_data = {
+                    "name": period["name"],
+                    "start": period["start"],
+                    "end": period["end"],
+                    "imageCount": image_count,
+                    "indices": [
+                        {
+                            "id": index_id,
+                            "tileUrl": tile_urls[index_id],
+                            # Lets the tile proxy key its cache on the rendering, not the map ID
+                            "cacheKey": cache_keys[index_id]
+                        }
+                        for index_id in INDEX_EXPRESSIONS
+                    ]
+                }
             
-            map_data["periods"].append(period_data)
-            print(f"Successfully generated tile URLs for {period['name']}")
-        else:
-            print(f"No images found for period {period['name']}")
+                map_data["periods"].append(period_data)
+                print(f"Successfully generated tile URLs for {period['name']}")
+            else:
+                print(f"No images found for period {period['name']}")
+    
+    finally:
+        cache.close()
     
     # Save the map data to a JSON file
     output_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from email.utils import parsedate_to_datetime
+
+try:
+    from core import raw_archive
+except ImportError:
+    import raw_archive
+
+# Freshness assumed for responses that carry no Cache-Control/Expires; REData
+# serves no validators for most endpoints, and its data changes at most daily
+DEFAULT_TTL_SECONDS = 60 * 60
+
+# Entries not fetched or revalidated for this long are dropped when the cache is
+# opened, so backfills (one row per URL and window) don't grow it without bound
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 60 * 60
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'http_cache.sqlite'
+)
+
+def open_cache(path=DEFAULT_CACHE_PATH, max_age=DEFAULT_MAX_AGE_SECONDS):
+    """
+    Open (and create if needed) the SQLite HTTP response cache, evicting entries older than max_age seconds
+
+    Rows only hold the body's hash: bodies live once, compressed, in the
+    raw_archive the cache functions are given.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    if 'body' in {row['name'] for row in conn.execute("PRAGMA table_info(responses)")}:
+        # Caches from before bodies moved to the archive are dropped, not migrated
+        conn.execute("DROP TABLE responses")
+        conn.commit()
+        conn.execute("VACUUM")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS responses (
+            cache_key TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            params TEXT NOT NULL,
+            body_hash TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """)
+    conn.commit()
+    if max_age is not None:
+        evict_stale(conn, max_age)
+    return conn
+
+def make_cache_key(url, params=None):
+    """Build a stable key from the URL and its query parameters"""
+    payload = json.dumps({'url': url, 'params': params or {}}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def freshness_lifetime(headers, default_ttl=DEFAULT_TTL_SECONDS):
+    """Seconds a response may be reused without revalidation, from Cache-Control/Expires"""
+    cache_control = headers.get('Cache-Control', '').lower()
+    if 'no-store' in cache_control or 'no-cache' in cache_control:
+        return 0
+    match = re.search(r'(?:s-maxage|max-age)=(\d+)', cache_control)
+    if match:
+        return int(match.group(1))
+
+    expires = headers.get('Expires')
+    if expires:
+        try:
+            return max(0, parsedate_to_datetime(expires).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return 0
+    return default_ttl
+
+def lookup(conn, url, params=None, now=None, archive_dir=raw_archive.DEFAULT_ARCHIVE_DIR):
+    """
+    Find the cached response of a request
+
+    An entry whose body is no longer in the archive is treated as missing.
+
+    Returns:
+        tuple: (entry row or None, whether it is still fresh enough to use without a request)
+    """
+    now = time.time() if now is None else now
+    entry = conn.execute(
+        "SELECT * FROM responses WHERE cache_key = ?", (make_cache_key(url, params),)
+    ).fetchone()
+    if entry is not None and raw_archive.archive_path(entry['body_hash'], archive_dir) is None:
+        entry = None
+    return entry, entry is not None and entry['expires_at'] > now
+
+def read_body(entry, archive_dir=raw_archive.DEFAULT_ARCHIVE_DIR):
+    """Body bytes of a cached entry, read back from the raw archive"""
+    with raw_archive.open_body(entry['body_hash'], archive_dir) as f:
+        return f.read()
+
+def conditional_headers(entry):
+    """If-None-Match/If-Modified-Since headers revalidating a cached entry"""
+    headers = {}
+    if entry is not None and entry['etag']:
+        headers['If-None-Match'] = entry['etag']
+    if entry is not None and entry['last_modified']:
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+def update(conn, url, params, status, headers, body, entry=None, default_ttl=DEFAULT_TTL_SECONDS,
+           archive_dir=raw_archive.DEFAULT_ARCHIVE_DIR):
+    """
+    Record a 200 or 304 response and return the current body
+
+    A 304 refreshes the cached entry's lifetime. A 200 replaces it, with
+    its body archived in archive_dir, and is reported as unchanged when the
+    body hashes the same as the cached one, so endpoints without validators
+    still let callers skip regeneration.
+
+    Returns:
+        tuple: (body bytes, whether the body differs from what was cached)
+    """
+    now = time.time()
+    expires_at = now + freshness_lifetime(headers, default_ttl)
+
+    if status == 304 and entry is not None:
+        conn.execute(
+            "UPDATE responses SET fetched_at = ?, expires_at = ? WHERE cache_key = ?",
+            (now, expires_at, entry['cache_key'])
+        )
+        conn.commit()
+        return read_body(entry, archive_dir), False
+
+    body_hash, _ = raw_archive.store(body, archive_dir)
+    conn.execute(
+        "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (make_cache_key(url, params), url, json.dumps(params or {}, sort_keys=True), body_hash,
+         headers.get('ETag'), headers.get('Last-Modified'), now, expires_at)
+    )
+    conn.commit()
+    return body, entry is None or entry['body_hash'] != body_hash
+
+def evict_stale(conn, max_age, now=None):
+    """Delete entries fetched more than max_age seconds ago and return how many were removed"""
+    now = time.time() if now is None else now
+    cursor = conn.execute("DELETE FROM responses WHERE fetched_at <= ?", (now - max_age,))
+    conn.commit()
+    return cursor.rowcount
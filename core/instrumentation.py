@@ -0,0 +1,147 @@
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Spans are always timed and folded into per-(kind, name) totals, which stay
+# small however long the process runs. Individual spans are only kept for the
+# trace once enable() has been called (or PODARIA_TRACE names the trace file
+# to write at exit), and then only the most recent MAX_TRACE_SPANS of them.
+MAX_TRACE_SPANS = 100000
+_spans = deque(maxlen=MAX_TRACE_SPANS)
+_totals = {}
+_lock = threading.Lock()
+# Innermost open span of the current thread or asyncio task
+_current = contextvars.ContextVar('podaria_span', default=None)
+_origin = time.perf_counter()
+_enabled = {'trace_path': None, 'active': False}
+
+class Span:
+    """One timed stage or blocking call; payload bytes can be added while it runs"""
+
+    __slots__ = ('kind', 'name', 'start', 'end', 'parent', 'thread', 'bytes', 'attrs', 'error')
+
+    def __init__(self, kind, name, parent, attrs):
+        self.kind = kind
+        self.name = name
+        self.parent = parent
+        self.thread = threading.get_ident()
+        self.bytes = 0
+        self.attrs = attrs
+        self.error = None
+        self.start = time.perf_counter()
+        self.end = None
+
+    def add_bytes(self, count):
+        self.bytes += count
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+@contextmanager
+def span(kind, name, **attrs):
+    """
+    Time a block as a span of the given kind ('stage', 'ee', 'http', ...)
+
+    Spans nest per thread and per asyncio task, so a stage's calls are
+    recorded as its children in the trace even when they run concurrently.
+    Exceptions are noted on the span and re-raised.
+
+    Yields:
+        Span: Call add_bytes() on it to account transferred payload
+    """
+    current = Span(kind, name, _current.get(), attrs)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _current.reset(token)
+        with _lock:
+            row = _totals.setdefault((kind, name), {'count': 0, 'total': 0.0, 'max': 0.0, 'bytes': 0, 'errors': 0})
+            row['count'] += 1
+            row['total'] += current.duration
+            row['max'] = max(row['max'], current.duration)
+            row['bytes'] += current.bytes
+            row['errors'] += current.error is not None
+            if _enabled['active']:
+                _spans.append(current)
+
+def spans():
+    """Snapshot of the finished spans kept for the trace (only recorded while enabled)"""
+    with _lock:
+        return list(_spans)
+
+def reset():
+    """Forget every recorded span"""
+    with _lock:
+        _spans.clear()
+        _totals.clear()
+
+def summarize():
+    """Per-(kind, name) count, total/max seconds, bytes and errors of every finished span"""
+    with _lock:
+        return {key: dict(row) for key, row in _totals.items()}
+
+def summary_table():
+    """Format summarize() as a text table, slowest first"""
+    rows = sorted(summarize().items(), key=lambda item: (item[0][0] != 'stage', -item[1]['total']))
+    lines = [f"{'kind':<8} {'name':<40} {'calls':>6} {'total s':>9} {'mean ms':>9} {'max ms':>9} {'MB':>8} {'errors':>6}"]
+    for (kind, name), row in rows:
+        lines.append(
+            f"{kind:<8} {name[:40]:<40} {row['count']:>6} {row['total']:>9.3f} "
+            f"{row['total'] / row['count'] * 1000:>9.1f} {row['max'] * 1000:>9.1f} "
+            f"{row['bytes'] / 1e6:>8.2f} {row['errors']:>6}"
+        )
+    return "\n".join(lines)
+
+def write_trace(path):
+    """
+    Write the spans as a Chrome trace (load it in chrome://tracing or Perfetto)
+
+    Each span is a complete ('X') event with its kind as category and bytes,
+    parent and error in args; the summary rows are included under 'summary'.
+    """
+    events = []
+    for s in spans():
+        args = dict(s.attrs, bytes=s.bytes)
+        if s.parent is not None:
+            args['parent'] = s.parent.name
+        if s.error is not None:
+            args['error'] = s.error
+        events.append({
+            'name': s.name, 'cat': s.kind, 'ph': 'X', 'pid': os.getpid(), 'tid': s.thread,
+            'ts': round((s.start - _origin) * 1e6), 'dur': round(s.duration * 1e6), 'args': args
+        })
+
+    summary = [dict(row, kind=kind, name=name) for (kind, name), row in summarize().items()]
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'summary': summary}, f, default=str)
+
+def _report():
+    if not _totals:
+        return
+    print("\n===== Timing Summary =====")
+    print(summary_table())
+    if _enabled['trace_path']:
+        write_trace(_enabled['trace_path'])
+        print(f"Trace written to {_enabled['trace_path']}")
+
+def enable(trace_path=None):
+    """Print the summary table at exit and, if trace_path is given, write the JSON trace there"""
+    _enabled['trace_path'] = trace_path or _enabled['trace_path']
+    if not _enabled['active']:
+        _enabled['active'] = True
+        atexit.register(_report)
+
+if os.environ.get('PODARIA_TRACE'):
+    enable(os.environ['PODARIA_TRACE'])
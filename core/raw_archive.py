@@ -0,0 +1,73 @@
+import gzip
+import hashlib
+import os
+import tempfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_ARCHIVE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'raw_archive'
+)
+
+# REData's JSON is highly repetitive; these levels compress it well at a modest CPU cost
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+
+def _suffix():
+    return '.json.zst' if zstandard is not None else '.json.gz'
+
+def body_hash(body):
+    """SHA-256 hex digest identifying a raw response body"""
+    return hashlib.sha256(body).hexdigest()
+
+def archive_path(digest, archive_dir=DEFAULT_ARCHIVE_DIR):
+    """Path of an archived body, whichever codec it was written with, or None if it isn't archived"""
+    for suffix in ('.json.zst', '.json.gz'):
+        path = os.path.join(archive_dir, digest[:2], digest + suffix)
+        if os.path.exists(path):
+            return path
+    return None
+
+def store(body, archive_dir=DEFAULT_ARCHIVE_DIR):
+    """
+    Archive a raw response body under its content hash
+
+    Bodies are compressed with zstd when the zstandard package is installed
+    and gzip otherwise. A body that is already archived is not written again,
+    so repeated pulls of unchanged data take no extra space.
+
+    Returns:
+        tuple: (SHA-256 hex digest, path of the archived file)
+    """
+    digest = body_hash(body)
+    existing = archive_path(digest, archive_dir)
+    if existing is not None:
+        return digest, existing
+
+    if zstandard is not None:
+        compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    else:
+        compressed = gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+    path = os.path.join(archive_dir, digest[:2], digest + _suffix())
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename, so concurrent fetches of the same body never expose a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(compressed)
+    os.replace(tmp_path, path)
+    return digest, path
+
+def open_body(digest, archive_dir=DEFAULT_ARCHIVE_DIR):
+    """Open an archived body as a decompressing binary stream (for ijson or json.load)"""
+    path = archive_path(digest, archive_dir)
+    if path is None:
+        raise FileNotFoundError(f"No archived response with hash {digest} in {archive_dir}")
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if zstandard is None:
+        raise RuntimeError(f"{path} is zstd-compressed; install zstandard to read it")
+    return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
@@ -1,69 +1,289 @@
+import argparse
+import asyncio
+import io
+import ijson
 import requests
 import pandas as pd
-import json
 import os
-import time
+
+try:
+    from core import http_cache, instrumentation, raw_archive, redata_cube, redata_store
+    from core.redata_client import DEFAULT_HEADERS, REDataClient
+except ImportError:
+    import http_cache
+    import instrumentation
+    import raw_archive
+    import redata_cube
+    import redata_store
+    from redata_client import DEFAULT_HEADERS, REDataClient
 
 # Create data directory if it doesn't exist
 os.makedirs('../data', exist_ok=True)
 
 # Function to fetch data from REData API
-def fetch_data(url, params, filename):
+def fetch_data(url, params, filename, cache=None, archive_dir=raw_archive.DEFAULT_ARCHIVE_DIR):
     print(f"Fetching data from {url} with params: {params}")
 
-    # Add custom User-Agent header to avoid 403 errors
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    }
-
     try:
-        # Make the request with custom headers
-        response = requests.get(url, params=params, headers=headers)
+        # Reuse a fresh cached response, otherwise revalidate the cached one
+        entry, fresh = (None, False) if cache is None else \
+            http_cache.lookup(cache, url, params, archive_dir=archive_dir)
+        if fresh:
+            body, changed = http_cache.read_body(entry, archive_dir), False
+        else:
+            # Make the request with custom headers
+            with instrumentation.span('http', f"redata {filename}") as call:
+                response = requests.get(url, params=params,
+                                        headers=dict(DEFAULT_HEADERS, **http_cache.conditional_headers(entry)))
+                call.add_bytes(len(response.content))
+            
+            # Check if the response is valid
+            if response.status_code != 200 and not (response.status_code == 304 and entry is not None):
+                print(f"Error: API request failed with status code {response.status_code}")
+                print("Response text:", response.text)
+                return None
+            
+            body, changed = response.content, True
+            if cache is not None:
+                body, changed = http_cache.update(cache, url, params, response.status_code,
+                                                  response.headers, response.content, entry,
+                                                  archive_dir=archive_dir)
         
-        # Check if the response is valid
-        if response.status_code != 200:
-            print(f"Error: API request failed with status code {response.status_code}")
-            print("Response text:", response.text)
-            return None
+        # Nothing new since the last run: keep the CSV written then
+        if not changed and os.path.exists(f'../data/{filename}.csv'):
+            print(f"{filename} unchanged since the last fetch, skipping regeneration")
+            return load_processed(filename)
         
         # Print raw response for debugging
-        print("Raw API Response:", response.text[:200])  # Print first 200 characters
+        print("Raw API Response:", body[:200].decode('utf-8', 'replace'))  # Print first 200 characters
 
-        # Try parsing JSON
-        try:
-            data = response.json()
-        except json.JSONDecodeError:
-            print("Error: Failed to parse JSON. Response might be empty.")
-            return None
+        return process_response(body, filename, archive_dir)
+
+    except Exception as e:
+        print(f"Error fetching data: {e}")
+        return None
+
+# Archive a raw API response and turn its values into a DataFrame
+def process_response(body, filename, archive_dir=raw_archive.DEFAULT_ARCHIVE_DIR):
+    # Save raw response, compressed and stored once per distinct body
+    digest, raw_filepath = raw_archive.store(body, archive_dir)
+    print(f"Raw data archived to {raw_filepath}")
+
+    df = extract_values(body)
+    if df is None:
+        return None
+
+    # Save to CSV
+    csv_filepath = f'../data/{filename}.csv'
+    df.to_csv(csv_filepath, index=False)
+    print(f"Processed data saved to {csv_filepath}")
+
+    return df
+
+# Stream the value rows of the first included series out of a response body
+# (bytes or a binary file), without building the whole document in memory
+def iter_values(body):
+    stream = io.BytesIO(body) if isinstance(body, (bytes, bytearray)) else body
+    series, row = -1, None
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if prefix == 'included.item' and event == 'start_map':
+            series += 1
+            if series > 0:
+                # Later series aren't used; stop before parsing them
+                return
+        elif prefix == 'included.item.attributes.values.item':
+            if event == 'start_map':
+                row = {}
+            elif event == 'end_map':
+                yield row
+        elif row is not None and prefix.startswith('included.item.attributes.values.item.') \
+                and event not in ('start_map', 'start_array', 'map_key'):
+            row[prefix.rsplit('.', 1)[1]] = value
+
+# Turn the values of an API response body into a DataFrame, or None if it has none
+def extract_values(body):
+    try:
+        df = pd.DataFrame(iter_values(body))
+    except ijson.JSONError:
+        print("Error: Failed to parse JSON. Response might be empty.")
+        return None
+
+    # Check if data contains expected keys
+    if df.empty or 'datetime' not in df:
+        print("Warning: No relevant data found in API response.")
+        return None
+
+    # Convert datetime strings to pandas datetime objects
+    df['datetime'] = parse_datetimes(df['datetime'])
+    return df
+
+# Parse API datetimes; a series spanning a DST change mixes +01:00 and +02:00 offsets
+def parse_datetimes(values):
+    return pd.to_datetime(values, utc=True).dt.tz_convert(API_TIMEZONE)
 
-        # Save raw response
-        raw_filepath = f'../data/{filename}_raw.json'
-        with open(raw_filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        print(f"Raw data saved to {raw_filepath}")
+# Read back the DataFrame process_response() saved for an unchanged response
+def load_processed(filename):
+    df = pd.read_csv(f'../data/{filename}.csv')
+    df['datetime'] = parse_datetimes(df['datetime'])
+    return df
 
-        # Check if data contains expected keys
-        if 'included' not in data or not data['included']:
-            print("Warning: No relevant data found in API response.")
+# Fetch several endpoints concurrently under the client's shared rate limit
+async def fetch_all(endpoints, params, cache_path=http_cache.DEFAULT_CACHE_PATH,
+                    archive_dir=raw_archive.DEFAULT_ARCHIVE_DIR):
+    cache = http_cache.open_cache(cache_path) if cache_path else None
+    async with REDataClient(cache=cache, archive_dir=archive_dir) as client:
+        async def fetch_one(name, url):
+            print(f"Fetching {name.replace('_', ' ')} from {url} with params: {params}")
+            body, changed = await client.fetch_body(url, params)
+            if body is None:
+                return None
+            if not changed and os.path.exists(f'../data/{name}.csv'):
+                print(f"{name} unchanged since the last fetch, skipping regeneration")
+                return load_processed(name)
+            try:
+                return process_response(body, name, archive_dir)
+            except Exception as e:
+                print(f"Error processing {name}: {e}")
+                return None
+
+        frames = await asyncio.gather(*(fetch_one(name, url) for name, url in endpoints.items()))
+    return dict(zip(endpoints, frames))
+
+# Longest date window the API accepts per request for each time_trunc; longer
+# ranges are rejected, so backfills are split into windows of at most this size
+MAX_WINDOWS = {
+    'hour': pd.DateOffset(days=31),
+    'day': pd.DateOffset(years=1),
+    'month': pd.DateOffset(years=1),
+    'year': pd.DateOffset(years=10)
+}
+
+API_TIMEZONE = 'Europe/Madrid'
+API_DATE_FORMAT = '%Y-%m-%dT%H:%M'
+
+# Split [start, end] into consecutive API-legal windows for a time_trunc
+def split_date_range(start_date, end_date, time_trunc):
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date)
+    if 'T' not in str(end_date):
+        # A bare end date includes that whole day
+        end += pd.Timedelta(days=1, minutes=-1)
+    windows = []
+    while start <= end:
+        # Windows end on the minute before the next one starts, so none overlap
+        next_start = start + MAX_WINDOWS[time_trunc]
+        window_end = min(next_start - pd.Timedelta(minutes=1), end)
+        windows.append((start.strftime(API_DATE_FORMAT), window_end.strftime(API_DATE_FORMAT)))
+        start = next_start
+    return windows
+
+# Fetch one endpoint's windows concurrently and join them into a single series
+async def fetch_windows(client, name, url, windows, time_trunc, params=None):
+    async def fetch_window(window_start, window_end):
+        window_params = dict(params or {}, start_date=window_start, end_date=window_end, time_trunc=time_trunc)
+        body, _ = await client.fetch_body(url, window_params)
+        if body is None:
             return None
+        # Already archived when it came through the cache; storing again is a no-op then
+        raw_archive.store(body, client.archive_dir)
+        return extract_values(body)
+
+    frames = await asyncio.gather(*(fetch_window(*window) for window in windows))
+    missing = sum(frame is None for frame in frames)
+    if missing:
+        print(f"Warning: {missing} of {len(windows)} windows failed for {name}")
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        return None
 
-        # Extract the relevant data
-        values = data['included'][0]['attributes']['values']
-        df = pd.DataFrame(values)
+    # Windows come back in order; keep the latest value where they overlap
+    return pd.concat(frames, ignore_index=True) \
+        .drop_duplicates(subset='datetime', keep='last') \
+        .sort_values('datetime', kind='stable') \
+        .reset_index(drop=True)
 
-        # Convert datetime strings to pandas datetime objects
-        df['datetime'] = pd.to_datetime(df['datetime'])
+# Backfill one contiguous series per endpoint over an arbitrary date range
+async def backfill(endpoints, start_date, end_date, time_trunc, params=None,
+                   cache_path=http_cache.DEFAULT_CACHE_PATH, archive_dir=raw_archive.DEFAULT_ARCHIVE_DIR):
+    windows = split_date_range(start_date, end_date, time_trunc)
+    print(f"Backfilling {len(endpoints)} endpoints from {start_date} to {end_date} "
+          f"by {time_trunc} in {len(windows)} windows each")
 
-        # Save to CSV
-        csv_filepath = f'../data/{filename}.csv'
+    cache = http_cache.open_cache(cache_path) if cache_path else None
+    async with REDataClient(cache=cache, archive_dir=archive_dir) as client:
+        # Every window of every endpoint is in flight at once under the shared limiter
+        frames = await asyncio.gather(*(
+            fetch_windows(client, name, url, windows, time_trunc, params)
+            for name, url in endpoints.items()
+        ))
+
+    results = {}
+    for name, df in zip(endpoints, frames):
+        results[name] = df
+        if df is None:
+            continue
+        csv_filepath = f'../data/{name}_{time_trunc}.csv'
         df.to_csv(csv_filepath, index=False)
-        print(f"Processed data saved to {csv_filepath}")
+        print(f"Backfilled {len(df)} {time_trunc} values for {name} to {csv_filepath}")
+    return results
 
-        return df
+# Request params selecting one autonomous community's series
+def region_params(params, geo_id):
+    return dict(params, geo_trunc='electric_system', geo_limit='ccaa', geo_ids=str(geo_id))
 
-    except Exception as e:
-        print(f"Error fetching data: {e}")
-        return None
+# Append only the values newer than what the Parquet store already holds,
+# refreshing its newest one.
+# With geo_ids, every endpoint is fetched for each of those regions, all under
+# one client and so one shared rate limit, into the region-keyed store
+async def fetch_incremental(endpoints, params, end_date=None, geo_ids=None,
+                            store_dir=redata_store.DEFAULT_STORE_DIR, cache_path=http_cache.DEFAULT_CACHE_PATH,
+                            cube_path=redata_cube.DEFAULT_CUBE_PATH, archive_dir=raw_archive.DEFAULT_ARCHIVE_DIR):
+    time_trunc = params.get('time_trunc', 'month')
+    end_date = end_date or pd.Timestamp.now(tz=API_TIMEZONE).strftime(API_DATE_FORMAT)
+    latest = redata_store.latest_datetimes(store_dir)
+    base_params = {key: value for key, value in params.items()
+                   if key not in ('start_date', 'end_date', 'time_trunc')}
+    requests_by_geo = {redata_store.params_geo_id(params): base_params} if geo_ids is None else \
+        {str(geo_id): region_params(base_params, geo_id) for geo_id in geo_ids}
+
+    cache = http_cache.open_cache(cache_path) if cache_path else None
+    # The aggregate cube is kept in step with the store from the same new rows,
+    # after catching up on anything stored while it wasn't being maintained
+    cube = redata_cube.open_cube(cube_path) if cube_path else None
+    if cube is not None:
+        redata_cube.sync(cube, store_dir)
+    async with REDataClient(cache=cache, archive_dir=archive_dir) as client:
+        async def update_one(name, url, geo_id, geo_params):
+            since = latest.get((name, geo_id))
+            # Restart from the newest stored value's own period, which was likely
+            # still incomplete when fetched; append_rows() replaces it
+            start_date = params['start_date'] if since is None else \
+                since.tz_convert(API_TIMEZONE).strftime(API_DATE_FORMAT)
+            windows = split_date_range(start_date, end_date, time_trunc)
+            label = f"{name} ({redata_store.region_name(geo_id)})"
+            print(f"Updating {label} from {start_date} to {end_date} in {len(windows)} windows")
+
+            df = await fetch_windows(client, label, url, windows, time_trunc, geo_params)
+            if df is None:
+                return None
+            new_rows, replaced = redata_store.append_rows(name, geo_id, df, store_dir, since=since)
+            if cube is not None:
+                redata_cube.update(cube, name, geo_id, new_rows, replaced, store_dir)
+            print(f"Appended {len(new_rows) - len(replaced)} new {time_trunc} values for {label} to {store_dir}"
+                  + (f", refreshed {len(replaced)}" if len(replaced) else ""))
+            return new_rows
+
+        jobs = [(name, geo_id) for name in endpoints for geo_id in requests_by_geo]
+        frames = await asyncio.gather(*(
+            update_one(name, endpoints[name], geo_id, requests_by_geo[geo_id]) for name, geo_id in jobs
+        ))
+
+    results = {}
+    for name in endpoints:
+        endpoint_frames = [frame for (job_name, _), frame in zip(jobs, frames)
+                           if job_name == name and frame is not None]
+        results[name] = pd.concat(endpoint_frames, ignore_index=True) if endpoint_frames else None
+    return results
 
 # Define API endpoints and parameters
 api_endpoints = {
@@ -82,13 +302,31 @@ common_params = {
 
 # Fetch each dataset
 def main():
+    parser = argparse.ArgumentParser(description="Fetch REData API data for Galicia")
+    parser.add_argument('--backfill', nargs=2, metavar=('START', 'END'),
+                        help="Fetch a contiguous series over a date range (YYYY-MM-DD) instead of common_params")
+    parser.add_argument('--time-trunc', choices=sorted(MAX_WINDOWS), default='month',
+                        help="Granularity of a backfill")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only request values newer than the Parquet store's and append them to it")
+    parser.add_argument('--regions', nargs='*', metavar='GEO_ID',
+                        help="Incrementally fetch every endpoint for these autonomous community geo IDs "
+                             "(all of them if none are given) into the region-keyed store")
+    args = parser.parse_args()
+
     print("\nFetching REData API data for Galicia electrical grid and outages...\n")
 
-    results = {}
-    for name, url in api_endpoints.items():
-        print(f"\nFetching {name.replace('_', ' ')}...")
-        results[name] = fetch_data(url, common_params, name)
-        time.sleep(5)  # Add a delay between requests to avoid rate limiting
+    if args.backfill:
+        results = asyncio.run(backfill(api_endpoints, *args.backfill, args.time_trunc))
+    elif args.regions is not None:
+        geo_ids = args.regions or list(redata_store.REGIONS)
+        results = asyncio.run(fetch_incremental(api_endpoints, common_params, geo_ids=geo_ids))
+    elif args.incremental:
+        results = asyncio.run(fetch_incremental(api_endpoints, common_params))
+    else:
+        # All endpoints are requested at once; the client's token bucket and
+        # retries take care of rate limiting and the API's transient 500s
+        results = asyncio.run(fetch_all(api_endpoints, common_params))
 
     # Summary
     print("\n===== Data Fetching Summary =====")
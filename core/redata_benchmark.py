@@ -0,0 +1,179 @@
+import argparse
+import asyncio
+import contextlib
+import functools
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy as np
+
+try:
+    from core.redata_mock import REDataMock
+except ImportError:
+    from redata_mock import REDataMock
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Widgets the fetch_data and client scenarios cycle through
+SERIES_WIDGETS = [
+    'transporte/kilometros-lineas',
+    'transporte/capacidad-transformacion',
+    'indisponibilidades/tasa-indisponibilidad',
+]
+
+SCENARIOS = ['fetch_data', 'redata_fetcher', 'client']
+
+def latency_stats(latencies, wall):
+    """Throughput and p50/p95/p99 latency (ms) of a run"""
+    latencies = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0.0, 0.0, 0.0)
+    return {'throughput': len(latencies) / wall if wall else 0.0, 'p50': p50, 'p95': p95, 'p99': p99}
+
+def _timed(call):
+    start = time.perf_counter()
+    result = call()
+    return time.perf_counter() - start, result is not None
+
+def run_blocking(calls, concurrency):
+    """Run blocking callables on a thread pool; returns (latencies, successes, wall seconds)"""
+    start = time.perf_counter()
+    # The fetchers print progress on every call; keep it out of the report
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(_timed, calls))
+    wall = time.perf_counter() - start
+    return [latency for latency, _ in results], sum(ok for _, ok in results), wall
+
+def bench_fetch_data(base_url, count, concurrency, params, work_dir):
+    """core/redata_api.fetch_data, one synchronous request per call"""
+    try:
+        from core import redata_api
+    except ImportError:
+        import redata_api
+
+    # Keep archived bodies in the scratch directory instead of data/raw_archive
+    archive_dir = os.path.join(work_dir, 'raw_archive')
+    calls = [
+        functools.partial(redata_api.fetch_data, f"{base_url}/{SERIES_WIDGETS[i % len(SERIES_WIDGETS)]}",
+                          params, f"bench_{i}", archive_dir=archive_dir)
+        for i in range(count)
+    ]
+    return run_blocking(calls, concurrency)
+
+def bench_redata_fetcher(base_url, count, concurrency, params, work_dir):
+    """archive/redata_fetcher's grid and outage fetchers, alternating"""
+    sys.path.insert(0, PROJECT_ROOT)
+    from archive import redata_fetcher
+
+    fetchers = [redata_fetcher.fetch_grid_data, redata_fetcher.fetch_outage_data]
+    with mock.patch.object(redata_fetcher, 'BASE_URL', base_url):
+        return run_blocking([fetchers[i % len(fetchers)] for i in range(count)], concurrency)
+
+def bench_client(base_url, count, concurrency, params, work_dir):
+    """core/redata_client.REDataClient, all requests in flight under its connection limit"""
+    try:
+        from core.redata_client import REDataClient
+    except ImportError:
+        from redata_client import REDataClient
+
+    async def run():
+        # The client's own limiter is opened up so the server and network set the pace
+        async with REDataClient(rate=1e6, burst=count, max_connections=concurrency) as client:
+            async def one(i):
+                start = time.perf_counter()
+                data = await client.get_json(f"{base_url}/{SERIES_WIDGETS[i % len(SERIES_WIDGETS)]}", params)
+                return time.perf_counter() - start, data is not None
+
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = await asyncio.gather(*(one(i) for i in range(count)))
+            return results, time.perf_counter() - start
+
+    results, wall = asyncio.run(run())
+    return [latency for latency, _ in results], sum(ok for _, ok in results), wall
+
+BENCHMARKS = {'fetch_data': bench_fetch_data, 'redata_fetcher': bench_redata_fetcher, 'client': bench_client}
+
+def run_benchmarks(scenarios=SCENARIOS, count=100, concurrency=8, params=None, **mock_options):
+    """
+    Drive the REData fetchers against a local REDataMock
+
+    Runs in a scratch directory, since the fetchers write their CSV/JSON
+    output relative to the working directory.
+
+    Args:
+        scenarios (list): Names from SCENARIOS to run
+        count (int): Calls per scenario
+        concurrency (int): Calls in flight at once
+        params (dict): Query parameters for the value-series endpoints
+        **mock_options: REDataMock settings (latency, error_rate, rate_limit, ...)
+
+    Returns:
+        dict: Scenario -> calls, successes, wall seconds, throughput, p50/p95/p99 ms and server response counts
+    """
+    params = params or {'start_date': '2024-01-01T00:00', 'end_date': '2024-12-31T23:59', 'time_trunc': 'day'}
+    server = REDataMock(**mock_options)
+    base_url = server.start_in_thread()
+    previous_cwd = os.getcwd()
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory(prefix='redata_bench_') as work_dir:
+            # fetch_data writes to ../data and redata_fetcher to data/
+            os.makedirs(os.path.join(work_dir, 'data'))
+            os.makedirs(os.path.join(work_dir, 'core', 'data'))
+            os.chdir(os.path.join(work_dir, 'core'))
+
+            for name in scenarios:
+                server.stats = dict.fromkeys(server.stats, 0)
+                latencies, successes, wall = BENCHMARKS[name](base_url, count, concurrency, params, work_dir)
+                results[name] = dict(latency_stats(latencies, wall), calls=len(latencies), ok=successes,
+                                     wall=wall, server=dict(server.stats))
+    finally:
+        os.chdir(previous_cwd)
+        server.stop_thread()
+    return results
+
+def report_table(results):
+    """Format run_benchmarks() results as a text table"""
+    lines = [f"{'scenario':<16} {'calls':>6} {'ok':>6} {'wall s':>8} {'req/s':>8} "
+             f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  server responses"]
+    for name, row in results.items():
+        server = ', '.join(f"{key}: {value}" for key, value in row['server'].items() if value)
+        lines.append(f"{name:<16} {row['calls']:>6} {row['ok']:>6} {row['wall']:>8.2f} {row['throughput']:>8.1f} "
+                     f"{row['p50']:>8.1f} {row['p95']:>8.1f} {row['p99']:>8.1f}  {server}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the REData fetchers against a local mock of the API")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--calls', type=int, default=100, help="Calls per scenario")
+    parser.add_argument('--concurrency', type=int, default=8, help="Calls in flight at once")
+    parser.add_argument('--time-trunc', choices=['hour', 'day', 'month', 'year'], default='day',
+                        help="Granularity of the 2024 series requested, which sets the payload size")
+    parser.add_argument('--series', type=int, default=1, help="Included value series per response")
+    parser.add_argument('--latency', type=float, default=0.05, help="Server-side seconds per response")
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of responses that are 500s")
+    parser.add_argument('--rate-limit', type=float, default=None, help="Server requests per second before 429s")
+    parser.add_argument('--json', metavar='PATH', help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    params = {'start_date': '2024-01-01T00:00', 'end_date': '2024-12-31T23:59', 'time_trunc': args.time_trunc}
+    print("\n===== REData Fetcher Benchmark =====\n")
+    results = run_benchmarks(args.scenarios, args.calls, args.concurrency, params, latency=args.latency,
+                             jitter=args.jitter, error_rate=args.error_rate, rate_limit=args.rate_limit,
+                             series=args.series)
+    print(report_table(results))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, default=float)
+        print(f"\nResults written to {args.json}")
+
+if __name__ == "__main__":
+    main()
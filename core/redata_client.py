@@ -0,0 +1,175 @@
+import asyncio
+import json
+import random
+import time
+
+import aiohttp
+
+try:
+    from core import http_cache, instrumentation, raw_archive
+except ImportError:
+    import http_cache
+    import instrumentation
+    import raw_archive
+
+# Custom User-Agent header to avoid 403 errors
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+}
+
+# REData publishes no hard quota; sustained bursts above a few requests per
+# second start returning 429/500s, so stay at 2 req/s with short bursts of 4
+DEFAULT_RATE = 2.0
+DEFAULT_BURST = 4
+DEFAULT_MAX_CONNECTIONS = 8
+
+# Transient failures (the API's intermittent 500s, 429 throttling, gateway errors) are retried
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+DEFAULT_RETRIES = 4
+DEFAULT_BACKOFF = 1.0
+MAX_BACKOFF = 30.0
+
+
+class TokenBucket:
+    """Asyncio token bucket: `rate` requests per second with bursts of up to `capacity`"""
+
+    def __init__(self, rate=DEFAULT_RATE, capacity=DEFAULT_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a request may be sent"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class REDataClient:
+    """
+    Concurrent REData API client with one pooled session, a shared rate limit and retries
+
+    Use as an async context manager:
+
+        async with REDataClient() as client:
+            data = await client.get_json(url, params)
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, timeout=60, limiter=None, cache=None,
+                 archive_dir=raw_archive.DEFAULT_ARCHIVE_DIR):
+        # Pass a shared limiter to keep several clients under one combined rate
+        self.limiter = limiter or TokenBucket(rate, burst)
+        self.max_connections = max_connections
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        # Optional http_cache connection for conditional, cached requests, and
+        # the raw archive its bodies are kept in
+        self.cache = cache
+        self.archive_dir = archive_dir
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            headers=DEFAULT_HEADERS,
+            connector=aiohttp.TCPConnector(limit=self.max_connections),
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    def _retry_delay(self, attempt, retry_after=None):
+        # Full jitter: a random delay up to the exponential bound, so retries from
+        # concurrent requests spread out instead of hitting the API together
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(MAX_BACKOFF, self.backoff * 2 ** attempt))
+
+    async def get(self, url, params=None, headers=None):
+        """
+        GET a URL under the rate limit, retrying transient failures
+
+        Returns:
+            tuple: (status code, response headers, body bytes); status is None
+            if every attempt failed with a connection error or timeout
+        """
+        status, response_headers, body = None, {}, b''
+        for attempt in range(self.retries + 1):
+            await self.limiter.acquire()
+            retry_after = None
+            try:
+                with instrumentation.span('http', 'redata', url=url) as call:
+                    async with self.session.get(url, params=params, headers=headers) as response:
+                        status, response_headers, body = response.status, response.headers, await response.read()
+                        call.add_bytes(len(body))
+                if status not in RETRY_STATUSES:
+                    return status, response_headers, body
+                if status == 429 and response_headers.get('Retry-After', '').isdigit():
+                    retry_after = float(response_headers['Retry-After'])
+                print(f"REData returned {status} for {url} (attempt {attempt + 1}/{self.retries + 1})")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = None
+                print(f"Error fetching {url} (attempt {attempt + 1}/{self.retries + 1}): {e!r}")
+
+            if attempt < self.retries:
+                await asyncio.sleep(self._retry_delay(attempt, retry_after))
+
+        return status, response_headers, body
+
+    async def get_json(self, url, params=None):
+        """GET and parse a JSON response, or return None after printing why it failed"""
+        data, _ = await self.fetch_json(url, params)
+        return data
+
+    async def fetch_body(self, url, params=None):
+        """
+        GET a response body, going through the HTTP cache if one is set
+
+        A fresh cached response is returned without any request; a stale one
+        is revalidated with If-None-Match/If-Modified-Since.
+
+        Returns:
+            tuple: (body bytes or None, whether the body changed since it was last cached)
+        """
+        entry, fresh = (None, False) if self.cache is None else \
+            http_cache.lookup(self.cache, url, params, archive_dir=self.archive_dir)
+        if fresh:
+            return http_cache.read_body(entry, self.archive_dir), False
+
+        status, headers, body = await self.get(url, params, http_cache.conditional_headers(entry))
+        if status != 200 and not (status == 304 and entry is not None):
+            print(f"Error: API request to {url} failed with status code {status}")
+            return None, False
+
+        if self.cache is not None:
+            return http_cache.update(self.cache, url, params, status, headers, body, entry,
+                                     archive_dir=self.archive_dir)
+        return body, True
+
+    async def fetch_json(self, url, params=None):
+        """
+        GET and parse a JSON response through fetch_body()
+
+        Returns:
+            tuple: (parsed JSON or None, whether the body changed since it was last cached)
+        """
+        body, changed = await self.fetch_body(url, params)
+        if body is None:
+            return None, False
+
+        try:
+            return json.loads(body), changed
+        except json.JSONDecodeError:
+            print("Error: Failed to parse JSON. Response might be empty.")
+            return None, False
@@ -0,0 +1,220 @@
+import argparse
+import os
+import sqlite3
+
+import pandas as pd
+
+try:
+    from core import redata_store
+except ImportError:
+    import redata_store
+
+DEFAULT_CUBE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'redata_cube.sqlite'
+)
+
+# Period label format of each grain, on the same local calendar as the store's year partitions
+GRAINS = {'day': '%Y-%m-%d', 'month': '%Y-%m', 'year': '%Y'}
+
+def open_cube(path=DEFAULT_CUBE_PATH):
+    """Open (and create if needed) the SQLite aggregate cube"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS aggregates (
+            endpoint TEXT NOT NULL,
+            geo_id TEXT NOT NULL,
+            grain TEXT NOT NULL,
+            period TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            sum REAL NOT NULL,
+            min REAL NOT NULL,
+            max REAL NOT NULL,
+            PRIMARY KEY (endpoint, geo_id, grain, period)
+        )
+    """)
+    # Newest row folded in per series: cells can only be trusted while it
+    # matches the store's, since rows stored or replaced without the cube
+    # are missing from them
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS folded (
+            endpoint TEXT NOT NULL,
+            geo_id TEXT NOT NULL,
+            latest TEXT NOT NULL,
+            value REAL,
+            PRIMARY KEY (endpoint, geo_id)
+        )
+    """)
+    conn.commit()
+    return conn
+
+def _stamp(timestamp):
+    # Fixed-width UTC text, so stamps compare correctly as strings in SQL
+    return pd.Timestamp(timestamp).tz_convert('UTC').strftime('%Y-%m-%dT%H:%M:%S.%f')
+
+def is_current(conn, endpoint, geo_id, store_latest):
+    """Whether a series' cells cover the store up to its newest row, given as (datetime, value)"""
+    if store_latest is None:
+        return False
+    row = conn.execute("SELECT latest, value FROM folded WHERE endpoint = ? AND geo_id = ?",
+                       (endpoint, str(geo_id))).fetchone()
+    if row is None or row['latest'] != _stamp(store_latest[0]):
+        return False
+    # SQLite keeps NaN as NULL
+    return row['value'] == store_latest[1] or (row['value'] is None and pd.isna(store_latest[1]))
+
+def sync(conn, store_dir=redata_store.DEFAULT_STORE_DIR):
+    """
+    Rebuild the cube if any stored series isn't fully folded into it
+
+    That happens when the store was filled before the cube existed or by a
+    run without it. Returns whether a rebuild was needed.
+    """
+    stale = [key for key, latest in redata_store.latest_rows(store_dir).items()
+             if not is_current(conn, *key, latest)]
+    if stale:
+        print(f"Aggregate cube lags the store for {len(stale)} series, rebuilding it")
+        rebuild(conn, store_dir)
+    return bool(stale)
+
+def _cells(rows):
+    """(grain, period, count, sum, min, max) of every cell some of the rows fall in"""
+    rows = rows.dropna(subset=['value'])
+    if rows.empty:
+        return []
+    local = pd.to_datetime(rows['datetime'], utc=True).dt.tz_convert(redata_store.PARTITION_TIMEZONE)
+    cells = []
+    for grain, period_format in GRAINS.items():
+        grouped = rows['value'].groupby(local.dt.strftime(period_format)).agg(['count', 'sum', 'min', 'max'])
+        cells.extend(
+            (grain, period, int(row['count']), float(row['sum']), float(row['min']), float(row['max']))
+            for period, row in grouped.iterrows()
+        )
+    return cells
+
+def _recompute(conn, endpoint, geo_id, cells, store_dir):
+    """Reset cells from the rows the store holds for their periods (deleting cells left empty)"""
+    years = sorted({int(period[:4]) for _, period in cells})
+    df = redata_store.load(endpoint, columns=['datetime', 'value'], years=years, geo_ids=[geo_id],
+                           store_dir=store_dir)
+    current = {cell[:2]: cell[2:] for cell in _cells(df)} if df is not None else {}
+    for grain, period in cells:
+        conn.execute("DELETE FROM aggregates WHERE endpoint = ? AND geo_id = ? AND grain = ? AND period = ?",
+                     (endpoint, str(geo_id), grain, period))
+        if (grain, period) in current:
+            conn.execute("INSERT INTO aggregates VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (endpoint, str(geo_id), grain, period, *current[(grain, period)]))
+
+def update(conn, endpoint, geo_id, rows, replaced=None, store_dir=redata_store.DEFAULT_STORE_DIR):
+    """
+    Fold newly stored rows into the day, month and year aggregates
+
+    Counts and sums are added to and extremes widened in place, so each row
+    must be passed exactly once: pass what redata_store.append_rows() returns.
+    Rows it replaced are subtracted first; a cell whose minimum or maximum
+    came from a replaced row can't be narrowed that way and is recomputed
+    from the store's rows for its period.
+
+    Args:
+        conn: Connection from open_cube()
+        endpoint (str): Endpoint name
+        geo_id (str): Region the rows belong to
+        rows (DataFrame): New rows with 'datetime' and 'value' columns
+        replaced (DataFrame): Previously stored rows the new ones replaced
+        store_dir (str): Store holding the rows, read only to recompute cells
+
+    Returns:
+        int: Number of (grain, period) cells touched
+    """
+    stale = set()
+    for grain, period, count, total, low, high in _cells(replaced) if replaced is not None else []:
+        cell = conn.execute(
+            "SELECT * FROM aggregates WHERE endpoint = ? AND geo_id = ? AND grain = ? AND period = ?",
+            (endpoint, str(geo_id), grain, period)
+        ).fetchone()
+        if cell is None:
+            continue
+        if cell['count'] <= count or low <= cell['min'] or high >= cell['max']:
+            stale.add((grain, period))
+            continue
+        conn.execute(
+            "UPDATE aggregates SET count = count - ?, sum = sum - ? "
+            "WHERE endpoint = ? AND geo_id = ? AND grain = ? AND period = ?",
+            (count, total, endpoint, str(geo_id), grain, period)
+        )
+
+    cells = [cell for cell in _cells(rows) if cell[:2] not in stale]
+    conn.executemany("""
+        INSERT INTO aggregates VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (endpoint, geo_id, grain, period) DO UPDATE SET
+            count = count + excluded.count,
+            sum = sum + excluded.sum,
+            min = MIN(min, excluded.min),
+            max = MAX(max, excluded.max)
+    """, [(endpoint, str(geo_id), *cell) for cell in cells])
+
+    if stale:
+        # The store already holds the new rows, so this covers both sides
+        _recompute(conn, endpoint, geo_id, stale, store_dir)
+    if not rows.empty:
+        newest = rows.loc[pd.to_datetime(rows['datetime'], utc=True).idxmax()]
+        value = None if pd.isna(newest['value']) else float(newest['value'])
+        conn.execute("""
+            INSERT INTO folded VALUES (?, ?, ?, ?)
+            ON CONFLICT (endpoint, geo_id) DO UPDATE SET latest = excluded.latest, value = excluded.value
+            WHERE excluded.latest >= folded.latest
+        """, (endpoint, str(geo_id), _stamp(newest['datetime']), value))
+    conn.commit()
+    return len(cells) + len(stale)
+
+def _summary(row):
+    return dict(row, mean=row['sum'] / row['count'])
+
+def lookup(conn, endpoint, geo_id, grain, period):
+    """
+    Aggregates of one period by primary key, e.g. lookup(conn, 'transmission_lines', '17', 'year', '2024')
+
+    Returns:
+        dict: count, sum, min, max and mean, or None if nothing is stored for that period
+    """
+    row = conn.execute(
+        "SELECT * FROM aggregates WHERE endpoint = ? AND geo_id = ? AND grain = ? AND period = ?",
+        (endpoint, str(geo_id), grain, str(period))
+    ).fetchone()
+    return None if row is None else _summary(row)
+
+def series(conn, endpoint, geo_id, grain):
+    """Every period of one grain, oldest first, as a list of lookup()-style dicts"""
+    rows = conn.execute(
+        "SELECT * FROM aggregates WHERE endpoint = ? AND geo_id = ? AND grain = ? ORDER BY period",
+        (endpoint, str(geo_id), grain)
+    )
+    return [_summary(row) for row in rows]
+
+def rebuild(conn, store_dir=redata_store.DEFAULT_STORE_DIR):
+    """Recompute the whole cube from the Parquet store, e.g. for a store filled before the cube existed"""
+    conn.execute("DELETE FROM aggregates")
+    conn.execute("DELETE FROM folded")
+    conn.commit()
+    endpoints = sorted({endpoint for endpoint, _ in redata_store.latest_datetimes(store_dir)})
+    for endpoint in endpoints:
+        df = redata_store.load(endpoint, columns=['geo_id', 'datetime', 'value'], store_dir=store_dir)
+        for geo_id, rows in df.groupby('geo_id'):
+            update(conn, endpoint, geo_id, rows)
+    return endpoints
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the REData aggregate cube")
+    parser.add_argument('--rebuild', action='store_true', help="Recompute every aggregate from the Parquet store")
+    args = parser.parse_args()
+
+    conn = open_cube()
+    if args.rebuild:
+        endpoints = rebuild(conn)
+        print(f"Rebuilt aggregates of {len(endpoints)} endpoints into {DEFAULT_CUBE_PATH}")
+    for row in conn.execute("SELECT endpoint, grain, COUNT(*) AS cells FROM aggregates GROUP BY endpoint, grain"):
+        print(f"{row['endpoint']:<24} {row['grain']:<6} {row['cells']} periods")
+
+if __name__ == "__main__":
+    main()
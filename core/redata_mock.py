@@ -0,0 +1,232 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+# Series the mock knows, by widget path: (title, typical magnitude, spread)
+SERIES = {
+    'transporte/kilometros-lineas': ('Kilómetros de líneas', 44500.0, 150.0),
+    'transporte/capacidad-transformacion': ('Capacidad de transformación', 92000.0, 400.0),
+    'indisponibilidades/tasa-indisponibilidad': ('Tasa de indisponibilidad', 2.1, 0.8),
+    'indisponibilidades/incidencias': ('Incidencias', 12.0, 6.0),
+}
+DEFAULT_SERIES = ('Indisponibilidades', 1.0, 0.5)
+
+TRUNC_FREQUENCIES = {'hour': 'h', 'day': 'D', 'month': 'MS', 'year': 'YS'}
+
+# Rough bounding box of peninsular Spain, for mapa-red and incidencias coordinates
+SPAIN_BOUNDS = (-9.3, 36.0, 3.3, 43.8)
+
+
+class REDataMock:
+    """
+    Local stand-in for apidatos.ree.es serving JSON:API payloads shaped like REData's
+
+    Serves /{lang}/datos/transporte/kilometros-lineas, .../capacidad-transformacion,
+    .../indisponibilidades/* and .../red-transporte/mapa-red. Values follow the
+    requested start_date/end_date/time_trunc and are deterministic per request,
+    so ETags are stable and If-None-Match is answered with 304.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.02, error_rate=0.0, rate_limit=None, burst=10,
+                 series=1, features=200, seed=0):
+        # Per-request delay in seconds: latency plus uniform noise of up to +/- jitter
+        self.latency = latency
+        self.jitter = jitter
+        # Fraction of requests answered with a 500, like the real API's intermittent failures
+        self.error_rate = error_rate
+        # Requests per second allowed across all clients before 429s (None disables the limit)
+        self.rate_limit = rate_limit
+        self.burst = burst
+        # Payload size: included series per response and features per mapa-red response
+        self.series = series
+        self.features = features
+        self.random = random.Random(seed)
+        self.stats = {'requests': 0, 200: 0, 304: 0, 429: 0, 500: 0}
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._runner = None
+        self._loop = None
+        self._thread = None
+        self.base_url = None
+
+    def _allow(self):
+        if self.rate_limit is None:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate_limit)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def series_payload(self, widget, query):
+        """JSON:API document with `series` included value series for a widget request"""
+        title, magnitude, spread = SERIES.get(widget, DEFAULT_SERIES)
+        time_trunc = query.get('time_trunc', 'month')
+        start = pd.Timestamp(query.get('start_date', '2024-01-01T00:00')).tz_localize('Europe/Madrid')
+        end = pd.Timestamp(query.get('end_date', '2024-12-31T23:59')).tz_localize('Europe/Madrid')
+        datetimes = pd.date_range(start.normalize(), end, freq=TRUNC_FREQUENCIES.get(time_trunc, 'MS'))
+
+        # Seeded by the request, so the same request always gets the same body
+        seed = int(hashlib.sha256(f"{widget}|{sorted(query.items())}".encode()).hexdigest()[:8], 16)
+        rng = np.random.default_rng(seed)
+        updated = pd.Timestamp('2025-01-01T00:00', tz='Europe/Madrid').isoformat(timespec='milliseconds')
+
+        included = []
+        for i in range(self.series):
+            values = np.round(magnitude + rng.normal(0, spread, len(datetimes)).cumsum() / 10, 3)
+            total = float(np.abs(values).sum()) or 1.0
+            included.append({
+                'type': f"{title} {i + 1}" if i else title,
+                'id': str(1000 + i),
+                'groupId': None,
+                'attributes': {
+                    'title': title,
+                    'description': None,
+                    'color': '#2f6fa7',
+                    'type': None,
+                    'magnitude': None,
+                    'composite': False,
+                    'last-update': updated,
+                    'values': [
+                        {'value': float(value), 'percentage': round(abs(float(value)) / total, 6),
+                         'datetime': dt.isoformat(timespec='milliseconds')}
+                        for value, dt in zip(values, datetimes)
+                    ]
+                }
+            })
+
+        return {
+            'data': {
+                'type': title,
+                'id': f"mock-{widget}",
+                'attributes': {'title': title, 'last-update': updated, 'description': None},
+                'meta': {'cache-control': {'cache': 'HIT', 'expireAt': updated}}
+            },
+            'included': included
+        }
+
+    def grid_payload(self, widget, query):
+        """JSON:API document of line/substation/incident items with coordinates"""
+        rng = np.random.default_rng(len(widget))
+        west, south, east, north = SPAIN_BOUNDS
+        points = np.column_stack([rng.uniform(west, east, self.features), rng.uniform(south, north, self.features)])
+
+        included = []
+        for i, (lon, lat) in enumerate(np.round(points, 5).tolist()):
+            if widget == 'indisponibilidades/incidencias':
+                item_type = 'incident'
+                attributes = {'name': f"Incidencia {i}", 'coordinates': [lon, lat], 'status': 'resuelta',
+                              'start_date': query.get('start_date', ''), 'end_date': query.get('end_date', '')}
+            elif i % 4:
+                item_type = 'line'
+                attributes = {'name': f"Línea {i}", 'voltage': '400kV' if i % 3 else '220kV',
+                              'coordinates': [[lon, lat], [round(lon + 0.3, 5), round(lat + 0.2, 5)]]}
+            else:
+                item_type = 'substation'
+                attributes = {'name': f"Subestación {i}", 'coordinates': [lon, lat]}
+            included.append({'type': item_type, 'id': str(i), 'attributes': attributes})
+
+        return {'data': {'type': widget, 'id': f"mock-{widget}", 'attributes': {}}, 'included': included}
+
+    async def handle(self, request):
+        self.stats['requests'] += 1
+        delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        if delay:
+            await asyncio.sleep(delay)
+
+        if not self._allow():
+            self.stats[429] += 1
+            return web.json_response({'errors': [{'code': 429, 'title': 'Too Many Requests'}]},
+                                     status=429, headers={'Retry-After': '1'})
+        if self.random.random() < self.error_rate:
+            self.stats[500] += 1
+            return web.json_response({'errors': [{'code': 500, 'title': 'Internal Server Error'}]}, status=500)
+
+        widget = request.match_info['widget']
+        query = dict(request.query)
+        if widget in ('red-transporte/mapa-red', 'indisponibilidades/incidencias'):
+            payload = self.grid_payload(widget, query)
+        else:
+            payload = self.series_payload(widget, query)
+
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        if request.headers.get('If-None-Match') == etag:
+            self.stats[304] += 1
+            return web.Response(status=304, headers={'ETag': etag})
+
+        self.stats[200] += 1
+        return web.Response(body=body, content_type='application/json', headers={'ETag': etag})
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/{lang}/datos/{widget:.+}', self.handle)
+        return app
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Start serving on the running event loop and return the base URL (…/en/datos)"""
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_host, bound_port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{bound_host}:{bound_port}/en/datos"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def start_in_thread(self, host='127.0.0.1', port=0):
+        """Serve from a background event loop, for driving it with blocking clients"""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        return asyncio.run_coroutine_threadsafe(self.start(host, port), self._loop).result()
+
+    def stop_thread(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the REData API")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.02, help="Uniform +/- noise on the latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with a 500")
+    parser.add_argument('--rate-limit', type=float, default=None, help="Requests per second before 429s")
+    parser.add_argument('--burst', type=int, default=10, help="Requests allowed at once under --rate-limit")
+    parser.add_argument('--series', type=int, default=1, help="Included value series per response")
+    parser.add_argument('--features', type=int, default=200, help="Items per mapa-red/incidencias response")
+    args = parser.parse_args()
+
+    mock = REDataMock(args.latency, args.jitter, args.error_rate, args.rate_limit, args.burst,
+                      args.series, args.features)
+
+    async def serve():
+        print(f"REData mock serving at {await mock.start(port=args.port)}")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print(f"\nStopped. Responses: {mock.stats}")
+
+if __name__ == "__main__":
+    main()
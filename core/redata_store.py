@@ -0,0 +1,215 @@
+import glob
+import os
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+DEFAULT_STORE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'redata_store'
+)
+
+# geo_id recorded for requests without geo_ids, which REData answers with national totals
+NATIONAL_GEO_ID = 'national'
+
+# REData geo_ids of the autonomous communities and autonomous cities (geo_limit=ccaa)
+REGIONS = {
+    '4': 'Andalucía',
+    '5': 'Aragón',
+    '6': 'Cantabria',
+    '7': 'Castilla-La Mancha',
+    '8': 'Castilla y León',
+    '9': 'Cataluña',
+    '10': 'País Vasco',
+    '11': 'Principado de Asturias',
+    '13': 'Comunidad de Madrid',
+    '14': 'Comunidad Foral de Navarra',
+    '15': 'Comunitat Valenciana',
+    '16': 'Extremadura',
+    '17': 'Galicia',
+    '20': 'La Rioja',
+    '21': 'Región de Murcia',
+    '8742': 'Canarias',
+    '8743': 'Illes Balears',
+    '8744': 'Ceuta',
+    '8745': 'Melilla',
+}
+GALICIA_GEO_ID = '17'
+
+# Columns kept in the files; endpoint and year are hive partition directories
+# (endpoint=<name>/year=<yyyy>/), so readers can skip whole endpoints and years
+STORE_SCHEMA = pa.schema([
+    ('geo_id', pa.string()),
+    ('datetime', pa.timestamp('us', tz='UTC')),
+    ('value', pa.float64()),
+    ('percentage', pa.float64()),
+])
+# Years are partitioned on REData's own calendar: its monthly and yearly values
+# are stamped at local midnight, which is still the previous year in UTC
+PARTITION_TIMEZONE = 'Europe/Madrid'
+PARTITION_SCHEMA = pa.schema([('endpoint', pa.string()), ('year', pa.int32())])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+
+def params_geo_id(params):
+    """geo_id a request's rows are stored under"""
+    return str((params or {}).get('geo_ids', NATIONAL_GEO_ID))
+
+def region_name(geo_id):
+    """Readable name of a stored geo_id"""
+    return REGIONS.get(str(geo_id), 'Spain' if str(geo_id) == NATIONAL_GEO_ID else f"geo {geo_id}")
+
+def _dataset(store_dir):
+    if not glob.glob(os.path.join(store_dir, 'endpoint=*', 'year=*', '*.parquet')):
+        return None
+    schema = pa.unify_schemas([STORE_SCHEMA, PARTITION_SCHEMA])
+    return ds.dataset(store_dir, schema=schema, format='parquet', partitioning=PARTITIONING)
+
+def latest_datetimes(store_dir=DEFAULT_STORE_DIR):
+    """Map (endpoint, geo_id) -> newest stored datetime (UTC), reading only those three columns"""
+    dataset = _dataset(store_dir)
+    if dataset is None:
+        return {}
+    table = dataset.to_table(columns=['endpoint', 'geo_id', 'datetime'])
+    latest = table.group_by(['endpoint', 'geo_id']).aggregate([('datetime', 'max')]).to_pylist()
+    return {(row['endpoint'], row['geo_id']): pd.Timestamp(row['datetime_max']) for row in latest}
+
+def _remove_rows(endpoint, geo_id, datetimes, store_dir):
+    """
+    Delete an endpoint's stored rows of one region at the given datetimes
+
+    Only files in the years those datetimes fall in are opened, and a file
+    is rewritten (or deleted once empty) only if it holds one of the rows.
+
+    Returns:
+        DataFrame: The rows removed, in STORE_SCHEMA columns
+    """
+    datetimes = pd.DatetimeIndex(datetimes)
+    targets = pa.array(datetimes, pa.timestamp('us', tz='UTC'))
+    removed = []
+    for year in sorted(set(datetimes.tz_convert(PARTITION_TIMEZONE).year)):
+        for path in glob.glob(os.path.join(store_dir, f'endpoint={endpoint}', f'year={year}', '*.parquet')):
+            table = pq.read_table(path, schema=STORE_SCHEMA)
+            mask = pc.and_(pc.equal(table['geo_id'], str(geo_id)), pc.is_in(table['datetime'], value_set=targets))
+            if not pc.any(mask).as_py():
+                continue
+            removed.append(table.filter(mask))
+            kept = table.filter(pc.invert(mask))
+            if kept.num_rows:
+                # Write then rename, so readers never see a partial file
+                tmp_path = path + '.tmp'
+                pq.write_table(kept, tmp_path)
+                os.replace(tmp_path, path)
+            else:
+                os.remove(path)
+    return pa.concat_tables(removed or [STORE_SCHEMA.empty_table()]).to_pandas()
+
+def latest_rows(store_dir=DEFAULT_STORE_DIR):
+    """Map (endpoint, geo_id) -> (newest stored datetime, its value); the value changes when that row is replaced"""
+    dataset = _dataset(store_dir)
+    if dataset is None:
+        return {}
+    df = dataset.to_table(columns=['endpoint', 'geo_id', 'datetime', 'value']).to_pandas()
+    newest = df.sort_values('datetime', kind='stable').groupby(['endpoint', 'geo_id']).last()
+    return {key: (row['datetime'], row['value']) for key, row in newest.iterrows()}
+
+def append_rows(endpoint, geo_id, df, store_dir=DEFAULT_STORE_DIR, since=None):
+    """
+    Append an endpoint's rows from `since` on to the store
+
+    Each call writes new files into the endpoint's year partitions. The row
+    stored at `since` is replaced by the incoming one, since the newest
+    period was likely still incomplete when it was fetched; no other stored
+    data is rewritten.
+
+    Args:
+        endpoint (str): Endpoint name, e.g. 'transmission_lines'
+        geo_id (str): Region the rows belong to
+        df (DataFrame): Rows from redata_api.extract_values()
+        since (Timestamp): Newest datetime already stored; older rows are dropped
+
+    Returns:
+        tuple: (DataFrame of the rows written, DataFrame of the stored rows they replaced)
+    """
+    rows = pd.DataFrame({
+        'geo_id': str(geo_id),
+        'datetime': pd.to_datetime(df['datetime'], utc=True),
+        'value': pd.to_numeric(df['value'], errors='coerce'),
+        'percentage': pd.to_numeric(df['percentage'], errors='coerce') if 'percentage' in df else float('nan'),
+    })
+    if since is not None:
+        rows = rows[rows['datetime'] >= since]
+    rows = rows.drop_duplicates(subset='datetime', keep='last').sort_values('datetime').reset_index(drop=True)
+    if rows.empty:
+        return rows, rows
+
+    replaced = rows.iloc[:0]
+    if since is not None and rows['datetime'].iloc[0] == since:
+        replaced = _remove_rows(endpoint, geo_id, [since], store_dir)
+
+    table = pa.Table.from_pandas(rows, schema=STORE_SCHEMA, preserve_index=False)
+    table = table.append_column('endpoint', pa.array([endpoint] * len(rows), pa.string()))
+    table = table.append_column('year', pa.array(rows['datetime'].dt.tz_convert(PARTITION_TIMEZONE).dt.year, pa.int32()))
+    # A unique basename per append keeps earlier files in the same partition
+    ds.write_dataset(table, store_dir, format='parquet', partitioning=PARTITIONING,
+                     basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+                     existing_data_behavior='overwrite_or_ignore')
+    return rows, replaced
+
+def stored_years(endpoint, store_dir=DEFAULT_STORE_DIR):
+    """Years an endpoint has partitions for, oldest first"""
+    paths = glob.glob(os.path.join(store_dir, f'endpoint={endpoint}', 'year=*'))
+    return sorted(int(os.path.basename(path).split('=', 1)[1]) for path in paths)
+
+def last_modified(endpoint, store_dir=DEFAULT_STORE_DIR):
+    """Modification time of an endpoint's newest file, or None if it has none"""
+    paths = glob.glob(os.path.join(store_dir, f'endpoint={endpoint}', 'year=*', '*.parquet'))
+    return max(map(os.path.getmtime, paths)) if paths else None
+
+def load(endpoint, columns=None, years=None, geo_ids=None, store_dir=DEFAULT_STORE_DIR):
+    """
+    Read an endpoint's rows as a DataFrame
+
+    Only the requested columns are read, and partitions outside `years` are
+    skipped without being opened. Datetimes are returned in UTC.
+
+    Args:
+        endpoint (str): Endpoint name
+        columns (list): Columns to read (default: all)
+        years (list): Only read these years' partitions
+        geo_ids (list): Only keep rows of these regions
+
+    Returns:
+        DataFrame: Matching rows, or None if the endpoint has nothing stored
+    """
+    dataset = _dataset(store_dir)
+    if dataset is None or not stored_years(endpoint, store_dir):
+        return None
+
+    condition = ds.field('endpoint') == endpoint
+    if years is not None:
+        condition &= ds.field('year').isin(list(years))
+    if geo_ids is not None:
+        condition &= ds.field('geo_id').isin([str(geo_id) for geo_id in geo_ids])
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+def region_table(endpoint, column='value', years=None, geo_ids=None, store_dir=DEFAULT_STORE_DIR):
+    """
+    Compare regions: one row per datetime and one column per region
+
+    Args:
+        endpoint (str): Endpoint name
+        column (str): Stored column to compare
+        years (list): Only read these years' partitions
+        geo_ids (list): Regions to include (default: every stored region)
+
+    Returns:
+        DataFrame: `column` values indexed by datetime with region names as columns, or None
+    """
+    df = load(endpoint, columns=['geo_id', 'datetime', column], years=years, geo_ids=geo_ids, store_dir=store_dir)
+    if df is None or df.empty:
+        return None
+    df['region'] = df['geo_id'].map(region_name)
+    return df.pivot_table(index='datetime', columns='region', values=column, aggfunc='last')
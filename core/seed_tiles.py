@@ -0,0 +1,132 @@
+import argparse
+import json
+import math
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    from core.generate_ee_tiles import GALICIA_BBOX
+    from core.tile_server import (DEFAULT_MAX_CACHE_BYTES, DEFAULT_TILE_STORE, DEFAULT_TILES_JSON,
+                                  TileCache, TileProxy, load_tile_templates, period_id)
+except ImportError:
+    from generate_ee_tiles import GALICIA_BBOX
+    from tile_server import (DEFAULT_MAX_CACHE_BYTES, DEFAULT_TILE_STORE, DEFAULT_TILES_JSON,
+                             TileCache, TileProxy, load_tile_templates, period_id)
+
+def lonlat_to_tile(lon, lat, zoom):
+    """Convert a longitude/latitude to the XYZ tile that contains it"""
+    n = 1 << zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    lat_rad = math.radians(lat)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def bbox_tiles(bbox, min_zoom, max_zoom):
+    """Yield every (z, x, y) tile covering a (west, south, east, north) box"""
+    west, south, east, north = bbox
+    for z in range(min_zoom, max_zoom + 1):
+        x_min, y_min = lonlat_to_tile(west, north, z)
+        x_max, y_max = lonlat_to_tile(east, south, z)
+        for x in range(x_min, x_max + 1):
+            for y in range(y_min, y_max + 1):
+                yield z, x, y
+
+def count_bbox_tiles(bbox, min_zoom, max_zoom):
+    """Number of tiles bbox_tiles() yields, without walking them"""
+    west, south, east, north = bbox
+    total = 0
+    for z in range(min_zoom, max_zoom + 1):
+        x_min, y_min = lonlat_to_tile(west, north, z)
+        x_max, y_max = lonlat_to_tile(east, south, z)
+        total += (x_max - x_min + 1) * (y_max - y_min + 1)
+    return total
+
+def seed_tiles(min_zoom=6, max_zoom=12, workers=8, tiles_json=DEFAULT_TILES_JSON,
+               store_path=DEFAULT_TILE_STORE, max_bytes=DEFAULT_MAX_CACHE_BYTES, origin=None):
+    """
+    Pre-download the Galicia tile pyramid for every period/index into the tile cache
+
+    Tiles already in the cache are skipped, so an interrupted run resumes
+    where it stopped when started again. Downloads run on a bounded pool of
+    `workers` threads with at most a few pending tiles per worker.
+
+    Returns:
+        dict: Counts of 'fetched', 'skipped' and 'failed' tiles
+    """
+    with open(tiles_json) as f:
+        map_data = json.load(f)
+    templates, aliases, versions = load_tile_templates(tiles_json)
+    cache = TileCache(store_path, max_bytes)
+    proxy = TileProxy(cache, templates, aliases, origin=origin, versions=versions, connections=workers)
+
+    layers = [
+        (period_id(period), index['id'])
+        for period in map_data['periods']
+        for index in period['indices']
+    ]
+    total = count_bbox_tiles(GALICIA_BBOX, min_zoom, max_zoom) * len(layers)
+    print(f"Seeding {total} tiles for {len(layers)} layers at zoom {min_zoom}-{max_zoom}...")
+
+    counts = {'fetched': 0, 'skipped': 0, 'failed': 0}
+    started = time.time()
+
+    def seed_one(layer, z, x, y):
+        data, _, _ = proxy.get_tile(layer[0], layer[1], z, x, y)
+        return data is not None
+
+    def report():
+        done = sum(counts.values())
+        rate = counts['fetched'] / max(time.time() - started, 1e-9)
+        print(f"  {done}/{total} tiles ({counts['fetched']} fetched, {counts['skipped']} cached, "
+              f"{counts['failed']} failed, {rate:.1f} tiles/s)")
+
+    def collect(done_futures):
+        for future in done_futures:
+            counts['fetched' if future.result() else 'failed'] += 1
+            if sum(counts.values()) % 500 == 0:
+                report()
+
+    pending = set()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for layer in layers:
+            for z, x, y in bbox_tiles(GALICIA_BBOX, min_zoom, max_zoom):
+                if cache.contains(proxy.layer(*layer), z, x, y):
+                    counts['skipped'] += 1
+                    continue
+
+                # Keep the queue bounded so memory doesn't grow with the pyramid size
+                if len(pending) >= workers * 4:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending.add(executor.submit(seed_one, layer, z, x, y))
+
+        done, pending = wait(pending)
+        collect(done)
+    except KeyboardInterrupt:
+        print("\nSeeding interrupted; run it again to resume from the cached tiles.")
+        for future in pending:
+            future.cancel()
+    finally:
+        executor.shutdown(wait=True)
+
+    report()
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-seed the local tile cache for the Galicia bounding box")
+    parser.add_argument('--min-zoom', type=int, default=6)
+    parser.add_argument('--max-zoom', type=int, default=12)
+    parser.add_argument('--workers', type=int, default=8, help="Concurrent tile downloads")
+    parser.add_argument('--max-cache-mb', type=int, default=DEFAULT_MAX_CACHE_BYTES // (1024 * 1024),
+                        help="Tile cache size cap; seeding beyond it evicts the oldest tiles")
+    parser.add_argument('--origin', help="Tile origin template overriding Earth Engine, "
+                                         "e.g. http://127.0.0.1:9001/{period}/{index}/{z}/{x}/{y}.png")
+    args = parser.parse_args()
+
+    print("\n===== Seeding Galicia Tile Cache =====\n")
+    seed_tiles(args.min_zoom, args.max_zoom, args.workers,
+               max_bytes=args.max_cache_mb * 1024 * 1024, origin=args.origin)
+
+if __name__ == "__main__":
+    main()
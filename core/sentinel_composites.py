@@ -0,0 +1,84 @@
+import ee
+
+try:
+    from core import ee_client
+except ImportError:
+    import ee_client
+
+SENTINEL_COLLECTION = 'COPERNICUS/S2_SR'
+
+# ee.Date.advance() step and unit for each supported compositing period
+PERIOD_UNITS = {
+    'week': (1, 'week'),
+    'month': (1, 'month'),
+    'season': (3, 'month')
+}
+
+# Joda patterns used to label each composite (e.g. "Jan 2023")
+PERIOD_NAME_FORMATS = {
+    'week': 'dd MMM yyyy',
+    'month': 'MMM yyyy',
+    'season': 'MMM yyyy'
+}
+
+def get_composites(region, start_date, end_date, period='month', cloud_max=30):
+    """
+    Build median composites for every period between two dates on the server
+
+    The Sentinel-2 collection is filtered once for the full range and then
+    grouped with ee.List.sequence().map(), so no per-period filtering or
+    graph building happens in Python.
+
+    Args:
+        region: ee.Geometry to filter the collection to
+        start_date: First day of the range (YYYY-MM-DD)
+        end_date: Last day of the range, inclusive (YYYY-MM-DD)
+        period: 'week', 'month' or 'season'
+        cloud_max: Maximum CLOUDY_PIXEL_PERCENTAGE of the images used
+
+    Returns:
+        ee.ImageCollection: One median composite per period with 'start',
+        'end', 'name' and 'image_count' properties
+    """
+    step, unit = PERIOD_UNITS[period]
+    name_format = PERIOD_NAME_FORMATS[period]
+
+    start = ee.Date(start_date)
+    end = ee.Date(end_date).advance(1, 'day')
+
+    sentinel = ee.ImageCollection(SENTINEL_COLLECTION) \
+        .filterBounds(region) \
+        .filterDate(start, end) \
+        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', cloud_max))
+
+    period_count = end.difference(start, unit).divide(step).ceil()
+
+    def composite_for(offset):
+        period_start = start.advance(ee.Number(offset).multiply(step), unit)
+        period_end = period_start.advance(step, unit)
+        images = sentinel.filterDate(period_start, period_end)
+        return images.median().set({
+            'system:time_start': period_start.millis(),
+            'start': period_start.format('yyyy-MM-dd'),
+            'end': period_end.advance(-1, 'day').format('yyyy-MM-dd'),
+            'name': period_start.format(name_format),
+            'image_count': images.size()
+        })
+
+    offsets = ee.List.sequence(0, period_count.subtract(1))
+    return ee.ImageCollection.fromImages(offsets.map(composite_for))
+
+def get_composite_periods(composites):
+    """Fetch the name, dates and image count of every composite in one request"""
+    rows = ee_client.get_info(composites.reduceColumns(
+        ee.Reducer.toList(4), ['name', 'start', 'end', 'image_count']
+    ).get('list'))
+
+    return [
+        {'name': name, 'start': start, 'end': end, 'imageCount': image_count}
+        for name, start, end, image_count in rows
+    ]
+
+def get_period_composite(composites, start):
+    """Select the composite of the period starting on `start` (YYYY-MM-DD)"""
+    return ee.Image(composites.filter(ee.Filter.eq('start', start)).first())
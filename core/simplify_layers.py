@@ -0,0 +1,101 @@
+import argparse
+import glob
+import json
+import os
+
+import shapely
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_LAYERS_DIR = os.path.join(PROJECT_ROOT, 'data', 'layers')
+
+# (first zoom, last zoom) of each precomputed level; the last band keeps full detail
+ZOOM_BANDS = [(0, 7), (8, 10), (11, 13), (14, 22)]
+
+def layer_sources():
+    """Map layer name -> source GeoJSON for the grid and every extracted polygon file"""
+    sources = {'electrical_grid': os.path.join(PROJECT_ROOT, 'data', 'electrical_grid.geojson')}
+    for path in sorted(glob.glob(os.path.join(PROJECT_ROOT, 'geo_polygons', '*.geojson'))):
+        sources[os.path.splitext(os.path.basename(path))[0]] = path
+    return {name: path for name, path in sources.items() if os.path.exists(path)}
+
+def zoom_band(zoom):
+    """Return the (first zoom, last zoom) band a map zoom level falls in"""
+    for band in ZOOM_BANDS:
+        if band[0] <= zoom <= band[1]:
+            return band
+    return ZOOM_BANDS[-1] if zoom > ZOOM_BANDS[-1][1] else ZOOM_BANDS[0]
+
+def band_tolerance(band):
+    """Simplification tolerance in degrees: half a screen pixel at the band's deepest zoom"""
+    if band == ZOOM_BANDS[-1]:
+        return 0.0
+    return 360.0 / (256 * 2 ** band[1]) / 2
+
+def level_path(layer, band, layers_dir=DEFAULT_LAYERS_DIR):
+    """Path of a layer's precomputed GeoJSON for one zoom band"""
+    return os.path.join(layers_dir, layer, f"z{band[0]}-{band[1]}.geojson")
+
+def simplify_layer(layer, source, layers_dir=DEFAULT_LAYERS_DIR, force=False):
+    """
+    Write one simplified copy of a GeoJSON layer per zoom band
+
+    Geometries are simplified with Douglas-Peucker in topology-preserving
+    mode, so polygons stay valid and rings don't collapse or cross.
+    Levels newer than their source are left alone unless `force` is set.
+
+    Returns:
+        dict: Band label -> (vertex count, bytes written); empty if up to date
+    """
+    if not force and all(
+        os.path.exists(level_path(layer, band, layers_dir))
+        and os.path.getmtime(level_path(layer, band, layers_dir)) >= os.path.getmtime(source)
+        for band in ZOOM_BANDS
+    ):
+        return {}
+
+    with open(source, encoding='utf-8') as f:
+        collection = json.load(f)
+
+    features = collection['features']
+    geometries = shapely.from_geojson([json.dumps(feature['geometry']) for feature in features])
+    os.makedirs(os.path.join(layers_dir, layer), exist_ok=True)
+
+    stats = {}
+    for band in ZOOM_BANDS:
+        tolerance = band_tolerance(band)
+        simplified = shapely.simplify(geometries, tolerance, preserve_topology=True) if tolerance else geometries
+
+        level = dict(collection, features=[
+            dict(feature, geometry=json.loads(geometry))
+            for feature, geometry, empty in zip(features, shapely.to_geojson(simplified), shapely.is_empty(simplified))
+            if not empty
+        ])
+        path = level_path(layer, band, layers_dir)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(level, f, ensure_ascii=False, separators=(',', ':'))
+
+        stats[f"z{band[0]}-{band[1]}"] = (int(shapely.get_num_coordinates(simplified).sum()), os.path.getsize(path))
+
+    return stats
+
+def build_simplified_layers(layers_dir=DEFAULT_LAYERS_DIR, force=False):
+    """Precompute the zoom-band levels of every layer, skipping layers already up to date"""
+    for layer, source in layer_sources().items():
+        stats = simplify_layer(layer, source, layers_dir, force)
+        if not stats:
+            print(f"  {layer}: up to date")
+            continue
+        levels = ", ".join(f"{band} {vertices} vertices / {size / 1024:.1f} KB"
+                           for band, (vertices, size) in stats.items())
+        print(f"  {layer}: {levels}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute zoom-band simplified GeoJSON layers for the map server")
+    parser.add_argument('--force', action='store_true', help="Rebuild levels even if they are up to date")
+    args = parser.parse_args()
+
+    print("\n===== Building Simplified Map Layers =====\n")
+    build_simplified_layers(force=args.force)
+
+if __name__ == "__main__":
+    main()
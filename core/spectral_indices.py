@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+
+# Band pair (a, b) of each normalized difference index, computed as (a - b) / (a + b).
+# The Earth Engine scripts pass these same pairs to normalizedDifference().
+INDEX_BANDS = {
+    'ndvi': ('B8', 'B4'),
+    'ndwi': ('B3', 'B8'),
+    'ndbi': ('B11', 'B8'),
+    'nbr': ('B8', 'B12')
+}
+
+SENTINEL_BANDS = ('B2', 'B3', 'B4', 'B8', 'B11', 'B12')
+
+# Rows per chunk; at full Sentinel-2 width (~20k px) this keeps each float32 band chunk near 40 MB
+DEFAULT_CHUNK_ROWS = 512
+
+def load_band_arrays(directory, bands=SENTINEL_BANDS):
+    """Memory-map the <band>.npy files found in a directory"""
+    arrays = {}
+    for band in bands:
+        path = os.path.join(directory, f"{band}.npy")
+        if os.path.exists(path):
+            arrays[band] = np.load(path, mmap_mode='r')
+    return arrays
+
+def open_index_outputs(directory, shape, indices=tuple(INDEX_BANDS)):
+    """Create float32 <index>.npy memory-maps to write full-size index rasters into"""
+    os.makedirs(directory, exist_ok=True)
+    return {
+        index: np.lib.format.open_memmap(os.path.join(directory, f"{index}.npy"), mode='w+',
+                                         dtype=np.float32, shape=shape)
+        for index in indices
+    }
+
+def iter_index_chunks(bands, indices=tuple(INDEX_BANDS), chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Compute every requested index for one block of rows at a time
+
+    Each band is read and converted to float32 once per chunk and shared by
+    every index that uses it. Pixels where a + b == 0 come out as NaN, like
+    Earth Engine's mask.
+
+    Args:
+        bands: Dict of band name -> 2-D array (in memory or memory-mapped)
+        indices: Index ids from INDEX_BANDS to compute
+        chunk_rows: Number of rows processed per chunk
+
+    Yields:
+        tuple: (row slice, {index id: float32 array for those rows})
+    """
+    needed = sorted({band for index in indices for band in INDEX_BANDS[index]})
+    missing = [band for band in needed if band not in bands]
+    if missing:
+        raise KeyError(f"Missing bands for {list(indices)}: {missing}")
+
+    rows = bands[needed[0]].shape[0]
+    for start in range(0, rows, chunk_rows):
+        rows_slice = slice(start, min(start + chunk_rows, rows))
+        chunk = {band: np.asarray(bands[band][rows_slice], dtype=np.float32) for band in needed}
+
+        results = {}
+        for index in indices:
+            a, b = INDEX_BANDS[index]
+            total = chunk[a] + chunk[b]
+            difference = chunk[a] - chunk[b]
+            valid = total != 0
+            np.divide(difference, total, out=difference, where=valid)
+            difference[~valid] = np.nan
+            results[index] = difference
+
+        yield rows_slice, results
+
+def compute_indices(bands, indices=tuple(INDEX_BANDS), chunk_rows=DEFAULT_CHUNK_ROWS, out=None):
+    """
+    Compute full index rasters from band arrays in one chunked pass
+
+    Args:
+        bands: Dict of band name -> 2-D array (in memory or memory-mapped)
+        indices: Index ids from INDEX_BANDS to compute
+        chunk_rows: Number of rows processed per chunk
+        out: Optional dict of index id -> preallocated array (e.g. from
+            open_index_outputs()) so results never have to fit in memory
+
+    Returns:
+        dict: Index id -> float32 array
+    """
+    if out is None:
+        shape = next(iter(bands.values())).shape
+        out = {index: np.empty(shape, dtype=np.float32) for index in indices}
+
+    for rows_slice, results in iter_index_chunks(bands, indices, chunk_rows):
+        for index, values in results.items():
+            out[index][rows_slice] = values
+
+    return out
+
+def index_means(bands, indices=tuple(INDEX_BANDS), chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Mean of each index over all valid pixels without materializing the rasters"""
+    sums = {index: 0.0 for index in indices}
+    counts = {index: 0 for index in indices}
+
+    for _, results in iter_index_chunks(bands, indices, chunk_rows):
+        for index, values in results.items():
+            valid = ~np.isnan(values)
+            sums[index] += float(values[valid].sum(dtype=np.float64))
+            counts[index] += int(valid.sum())
+
+    return {index: sums[index] / counts[index] if counts[index] else None for index in indices}
@@ -0,0 +1,464 @@
+import hashlib
+import json
+import os
+import queue
+import re
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from core import instrumentation
+    from core.simplify_layers import DEFAULT_LAYERS_DIR, ZOOM_BANDS, layer_sources, level_path, zoom_band
+    from core.vector_tiles import VectorTileSource
+except ImportError:
+    import instrumentation
+    from simplify_layers import DEFAULT_LAYERS_DIR, ZOOM_BANDS, layer_sources, level_path, zoom_band
+    from vector_tiles import VectorTileSource
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TILES_JSON = os.path.join(PROJECT_ROOT, 'data', 'satellite_tiles.json')
+DEFAULT_TILE_STORE = os.path.join(PROJECT_ROOT, 'data', 'tile_cache.mbtiles')
+DEFAULT_VECTOR_TILE_STORE = os.path.join(PROJECT_ROOT, 'data', 'vector_tiles.mbtiles')
+
+# Upper bound for the on-disk tile cache before least recently used tiles are evicted
+DEFAULT_MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+# SQLite connections shared by the request threads of one cache
+DEFAULT_CACHE_CONNECTIONS = 4
+# A hit only rewrites a tile's last_access once it is this old, so hits
+# normally stay read-only; eviction order is approximate to this interval
+LRU_TOUCH_INTERVAL = 5 * 60
+
+# Upstream keep-alive connections shared by all request threads
+DEFAULT_UPSTREAM_CONNECTIONS = 16
+
+TILE_PATH = re.compile(r'^/tiles/(?P<period>[^/]+)/(?P<index>[^/]+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.png$')
+LAYER_PATH = re.compile(r'^/layers/(?P<layer>[\w-]+)\.geojson$')
+VECTOR_TILE_PATH = re.compile(r'^/vt/(?P<layer>[\w-]+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.pbf$')
+
+def period_id(period):
+    """URL id of a period in satellite_tiles.json (e.g. 2023-01-01_2023-03-31)"""
+    return f"{period['start']}_{period['end']}"
+
+def load_tile_templates(tiles_json=DEFAULT_TILES_JSON):
+    """
+    Read the Earth Engine tile URL templates from satellite_tiles.json
+
+    Returns:
+        tuple: ({(period id, index id): tile URL template}, {'latest': period id},
+                {(period id, index id): tile_url_cache key of the rendering})
+    """
+    with open(tiles_json) as f:
+        map_data = json.load(f)
+
+    templates = {}
+    versions = {}
+    for period in map_data['periods']:
+        for index in period['indices']:
+            templates[(period_id(period), index['id'])] = index['tileUrl']
+            # Files written before the key was recorded fall back to hashing the URL,
+            # which at worst refetches tiles whenever the map ID is reissued
+            versions[(period_id(period), index['id'])] = index.get('cacheKey') or \
+                hashlib.sha256(index['tileUrl'].encode('utf-8')).hexdigest()
+
+    aliases = {}
+    if map_data['periods']:
+        aliases['latest'] = period_id(map_data['periods'][-1])
+    return templates, aliases, versions
+
+
+class TileCache:
+    """MBTiles-style SQLite tile store with a size cap and LRU eviction"""
+
+    def __init__(self, path=DEFAULT_TILE_STORE, max_bytes=DEFAULT_MAX_CACHE_BYTES, tile_format='png',
+                 connections=DEFAULT_CACHE_CONNECTIONS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._write_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A small fixed pool: the server starts a thread per request, so
+        # per-thread connections would mean a new connect on every request
+        self._pool = queue.LifoQueue()
+        for _ in range(connections):
+            self._pool.put(sqlite3.connect(path, timeout=30, check_same_thread=False))
+
+        with self._connection() as conn:
+            self._create(conn, tile_format)
+            self.total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM tiles").fetchone()[0]
+
+    @staticmethod
+    def _create(conn, tile_format):
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS tiles (
+                layer TEXT NOT NULL,
+                zoom_level INTEGER NOT NULL,
+                tile_column INTEGER NOT NULL,
+                tile_row INTEGER NOT NULL,
+                tile_data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (layer, zoom_level, tile_column, tile_row)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS tiles_last_access ON tiles (last_access)")
+        conn.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("INSERT OR IGNORE INTO metadata VALUES ('format', ?)", (tile_format,))
+        conn.commit()
+
+    @contextmanager
+    def _connection(self):
+        # Borrow a pooled connection; each is used by one thread at a time
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._pool.put(conn)
+
+    @staticmethod
+    def _tms_row(z, y):
+        # MBTiles stores rows bottom-up (TMS), XYZ URLs count them top-down
+        return (1 << z) - 1 - y
+
+    def get(self, layer, z, x, y):
+        """Return the cached tile bytes or None, marking the tile as recently used"""
+        key = (layer, z, x, self._tms_row(z, y))
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT tile_data, last_access FROM tiles "
+                "WHERE layer = ? AND zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                key
+            ).fetchone()
+            if row is None:
+                return None
+
+            now = time.time()
+            if now - row[1] >= LRU_TOUCH_INTERVAL:
+                with self._write_lock:
+                    conn.execute(
+                        "UPDATE tiles SET last_access = ? "
+                        "WHERE layer = ? AND zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                        (now,) + key
+                    )
+                    conn.commit()
+        return row[0]
+
+    def contains(self, layer, z, x, y):
+        """Check for a tile without touching its LRU position"""
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM tiles WHERE layer = ? AND zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (layer, z, x, self._tms_row(z, y))
+            ).fetchone()
+        return row is not None
+
+    def put(self, layer, z, x, y, data):
+        """Store a tile and evict the least recently used tiles beyond the size cap"""
+        key = (layer, z, x, self._tms_row(z, y))
+        with self._connection() as conn, self._write_lock:
+            previous = conn.execute(
+                "SELECT size FROM tiles WHERE layer = ? AND zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                key
+            ).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?, ?, ?, ?)",
+                key + (data, len(data), time.time())
+            )
+            self.total_bytes += len(data) - (previous[0] if previous else 0)
+
+            if self.total_bytes > self.max_bytes:
+                self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn):
+        # Trim to 90% of the cap so eviction doesn't run on every insert
+        target = int(self.max_bytes * 0.9)
+        while self.total_bytes > target:
+            rows = conn.execute(
+                "SELECT rowid, size FROM tiles ORDER BY last_access LIMIT 256"
+            ).fetchall()
+            if not rows:
+                break
+            for rowid, size in rows:
+                conn.execute("DELETE FROM tiles WHERE rowid = ?", (rowid,))
+                self.total_bytes -= size
+                if self.total_bytes <= target:
+                    break
+
+
+class TileProxy:
+    """Serve tiles from the cache, fetching each missing tile from upstream exactly once"""
+
+    def __init__(self, cache, templates=None, aliases=None, origin=None, timeout=30, versions=None,
+                 connections=DEFAULT_UPSTREAM_CONNECTIONS):
+        self.cache = cache
+        self.templates = templates or {}
+        # Period aliases such as "latest" are resolved before caching so they
+        # never serve tiles of an older period
+        self.aliases = aliases or {}
+        # Rendering key per layer (see load_tile_templates), part of the cache key
+        # so tiles rendered with other vis params or expressions are never served
+        self.versions = versions or {}
+        # Optional stand-in origin, e.g. "http://127.0.0.1:9001/{period}/{index}/{z}/{x}/{y}.png"
+        self.origin = origin
+        self.timeout = timeout
+        # One session for every request thread, so upstream connections are reused
+        adapter = HTTPAdapter(pool_connections=connections, pool_maxsize=connections)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    def upstream_url(self, period, index, z, x, y):
+        """Resolve the upstream URL of a tile, or None for unknown layers"""
+        if self.origin:
+            return self.origin.format(period=period, index=index, z=z, x=x, y=y)
+        template = self.templates.get((period, index))
+        if template is None:
+            return None
+        return template.format(z=z, x=x, y=y)
+
+    def layer(self, period, index):
+        """Cache layer name of a period/index, including its rendering key when known"""
+        period = self.aliases.get(period, period)
+        version = self.versions.get((period, index))
+        return f"{period}/{index}/{version[:16]}" if version else f"{period}/{index}"
+
+    def get_tile(self, period, index, z, x, y):
+        """Return (tile bytes or None, 'HIT'/'MISS', upstream status)"""
+        period = self.aliases.get(period, period)
+        layer = self.layer(period, index)
+        data = self.cache.get(layer, z, x, y)
+        if data is not None:
+            return data, 'HIT', 200
+
+        # Concurrent requests for the same missing tile wait on a single upstream fetch
+        key = (layer, z, x, y)
+        with self._inflight_lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = threading.Event()
+                self._inflight[key] = event
+
+        if not leader:
+            event.wait(self.timeout)
+            data = self.cache.get(layer, z, x, y)
+            return data, 'MISS', 200 if data is not None else 502
+
+        try:
+            url = self.upstream_url(period, index, z, x, y)
+            if url is None:
+                return None, 'MISS', 404
+            with instrumentation.span('http', 'tile upstream') as call:
+                response = self.session.get(url, timeout=self.timeout)
+                call.add_bytes(len(response.content))
+            if response.status_code != 200:
+                return None, 'MISS', response.status_code
+            self.cache.put(layer, z, x, y, response.content)
+            return response.content, 'MISS', 200
+        except requests.RequestException as e:
+            print(f"Error fetching tile {layer}/{z}/{x}/{y}: {e}")
+            return None, 'MISS', 502
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+            event.set()
+
+
+class MapRequestHandler(SimpleHTTPRequestHandler):
+    """Static file server for the project plus the /tiles/ proxy, /layers/ and /vt/ endpoints"""
+
+    def __init__(self, *args, proxy=None, layers_dir=DEFAULT_LAYERS_DIR, vector_tiles=None,
+                 vector_cache=None, **kwargs):
+        self.proxy = proxy
+        self.layers_dir = layers_dir
+        self.vector_tiles = vector_tiles
+        self.vector_cache = vector_cache
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        if path == '/layers/':
+            return self.send_layer_index()
+        match = LAYER_PATH.match(path)
+        if match is not None:
+            return self.send_layer(match['layer'], parse_qs(query))
+        match = VECTOR_TILE_PATH.match(path)
+        if match is not None:
+            return self.send_vector_tile(match['layer'], int(match['z']), int(match['x']), int(match['y']))
+
+        match = TILE_PATH.match(path)
+        if match is None:
+            return super().do_GET()
+
+        data, cache_status, status = self.proxy.get_tile(
+            match['period'], match['index'], int(match['z']), int(match['x']), int(match['y'])
+        )
+        if data is None:
+            self.send_error(status if status >= 400 else 502)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Cache-Control', 'public, max-age=86400')
+        self.send_header('X-Tile-Cache', cache_status)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_layer_index(self):
+        """List the available vector layers and the zoom bands they are precomputed for"""
+        body = json.dumps({
+            'layers': sorted(layer_sources()),
+            'zoomBands': ZOOM_BANDS,
+            'vectorTiles': self.vector_tiles is not None and self.vector_tiles.available()
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_layer(self, layer, query):
+        """Serve the simplified level of a layer matching the client's ?zoom="""
+        source = layer_sources().get(layer)
+        if source is None:
+            self.send_error(404)
+            return
+
+        try:
+            zoom = int(query.get('zoom', [ZOOM_BANDS[-1][0]])[0])
+        except ValueError:
+            self.send_error(400, "zoom must be an integer")
+            return
+
+        # Fall back to the full-detail source until the levels have been built
+        band = zoom_band(zoom)
+        path = level_path(layer, band, self.layers_dir)
+        if not os.path.exists(path):
+            path = source
+
+        with open(path, 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/geo+json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Zoom-Band', f"{band[0]}-{band[1]}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_vector_tile(self, layer, z, x, y):
+        """Serve a Mapbox Vector Tile of a layer, cut from its zoom-band level on first request"""
+        if self.vector_tiles is None or not self.vector_tiles.available():
+            self.send_error(501, "Vector tiles need the mapbox_vector_tile package")
+            return
+
+        version = self.vector_tiles.version(layer, z)
+        if version is None:
+            self.send_error(404)
+            return
+
+        # The level file's name and mtime are part of the key, so rebuilt layers never serve stale tiles
+        cache_layer = f"{layer}/{version}"
+        data = self.vector_cache.get(cache_layer, z, x, y)
+        cache_status = 'HIT'
+        if data is None:
+            data = self.vector_tiles.render(layer, z, x, y)
+            self.vector_cache.put(cache_layer, z, x, y, data)
+            cache_status = 'MISS'
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.mapbox-vector-tile')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('X-Tile-Cache', cache_status)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Tile requests are far too frequent to log one line each
+        if not self.path.startswith(('/tiles/', '/vt/')):
+            super().log_message(format, *args)
+
+
+def start_server(port=8000, tiles_json=DEFAULT_TILES_JSON, store_path=DEFAULT_TILE_STORE,
+                 max_bytes=DEFAULT_MAX_CACHE_BYTES, origin=None, vector_store_path=DEFAULT_VECTOR_TILE_STORE):
+    """Start the map server on a background thread and return it"""
+    templates, aliases, versions = load_tile_templates(tiles_json) if os.path.exists(tiles_json) else ({}, {}, {})
+    proxy = TileProxy(TileCache(store_path, max_bytes), templates, aliases, origin=origin, versions=versions)
+    vector_cache = TileCache(vector_store_path, max_bytes, tile_format='pbf')
+    handler = partial(MapRequestHandler, proxy=proxy, vector_tiles=VectorTileSource(),
+                      vector_cache=vector_cache, directory=PROJECT_ROOT)
+
+    server = ThreadingHTTPServer(('', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving {PROJECT_ROOT} with tile proxy on http://localhost:{port}/")
+    return server
+
+
+def solid_png(rgb, size=256):
+    """Encode a single-colour PNG tile without any imaging dependency"""
+    def chunk(kind, payload):
+        return struct.pack('>I', len(payload)) + kind + payload + struct.pack('>I', zlib.crc32(kind + payload))
+
+    row = b'\x00' + bytes(rgb) * size
+    header = struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(row * size)) + chunk(b'IEND', b''))
+
+
+class StandInOriginHandler(SimpleHTTPRequestHandler):
+    """Local tile origin answering /{period}/{index}/{z}/{x}/{y}.png with solid tiles"""
+
+    latency = 0.0
+
+    def do_GET(self):
+        parts = self.path.strip('/').rsplit('.', 1)[0].split('/')
+        if len(parts) != 5 or not all(p.isdigit() for p in parts[2:]):
+            self.send_error(404)
+            return
+        time.sleep(self.latency)
+        z, x, y = (int(p) for p in parts[2:])
+        data = solid_png(((x * 37) % 256, (y * 59) % 256, (z * 23) % 256))
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stand_in_origin(port=9001, latency=0.0):
+    """Start a stand-in tile origin for exercising the proxy without Earth Engine"""
+    handler = type('StandInOrigin', (StandInOriginHandler,), {'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    server = start_server()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\nShutting down the server...")
+        server.shutdown()
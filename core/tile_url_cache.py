@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+# Earth Engine map IDs stop serving tiles after a while, so cached URLs are only
+# trusted for this long after getMapId() issued them
+DEFAULT_MAX_AGE_SECONDS = 6 * 60 * 60
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'tile_url_cache.sqlite'
+)
+
+def open_cache(path=DEFAULT_CACHE_PATH):
+    """Open (and create if needed) the SQLite tile URL cache"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tile_urls (
+            cache_key TEXT PRIMARY KEY,
+            collection TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            cloud_filter REAL NOT NULL,
+            expression TEXT NOT NULL,
+            vis_params TEXT NOT NULL,
+            tile_url TEXT NOT NULL,
+            image_count INTEGER,
+            issued_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """)
+    conn.commit()
+    return conn
+
+def make_cache_key(collection, start_date, end_date, cloud_filter, expression, vis_params):
+    """Build a stable key from everything that changes the rendered tiles"""
+    payload = json.dumps({
+        'collection': collection,
+        'start': start_date,
+        'end': end_date,
+        'cloud_filter': cloud_filter,
+        'expression': expression,
+        'vis_params': vis_params
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def get_cached_tile(conn, cache_key, now=None):
+    """Return (tile_url, image_count) for an unexpired entry, or None"""
+    now = time.time() if now is None else now
+    row = conn.execute(
+        "SELECT tile_url, image_count FROM tile_urls WHERE cache_key = ? AND expires_at > ?",
+        (cache_key, now)
+    ).fetchone()
+    return row
+
+def store_tile(conn, cache_key, collection, start_date, end_date, cloud_filter, expression,
+               vis_params, tile_url, image_count, max_age=DEFAULT_MAX_AGE_SECONDS):
+    """Insert or replace a freshly issued tile URL"""
+    issued_at = time.time()
+    conn.execute(
+        "INSERT OR REPLACE INTO tile_urls VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (cache_key, collection, start_date, end_date, cloud_filter, expression,
+         json.dumps(vis_params, sort_keys=True), tile_url, image_count,
+         issued_at, issued_at + max_age)
+    )
+    conn.commit()
+
+def evict_expired(conn, now=None):
+    """Delete entries whose map IDs have expired and return how many were removed"""
+    now = time.time() if now is None else now
+    cursor = conn.execute("DELETE FROM tile_urls WHERE expires_at <= ?", (now,))
+    conn.commit()
+    return cursor.rowcount
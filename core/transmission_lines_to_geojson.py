@@ -4,6 +4,12 @@ import os
 import sys
 from datetime import datetime
 
+try:
+    from core import redata_cube, redata_store
+except ImportError:
+    import redata_cube
+    import redata_store
+
 # Ensure the data directory exists
 os.makedirs('../data', exist_ok=True)
 
@@ -32,14 +38,68 @@ def find_transmission_lines_csv():
     # If we can't find it, return None
     return None
 
+def store_total_km(geo_id, year, store_latest):
+    """Total of a year's stored values: a single aggregate cube lookup, or a store read if the cube lags the store"""
+    if os.path.exists(redata_cube.DEFAULT_CUBE_PATH):
+        cube = redata_cube.open_cube()
+        try:
+            summary = None
+            if redata_cube.is_current(cube, 'transmission_lines', geo_id, store_latest):
+                summary = redata_cube.lookup(cube, 'transmission_lines', geo_id, 'year', year)
+        finally:
+            cube.close()
+        if summary is not None:
+            return summary['sum']
+    print("Aggregate cube is missing or behind the store, summing the stored values instead")
+    df = redata_store.load('transmission_lines', columns=['value'], years=[year], geo_ids=[geo_id])
+    return df['value'].sum()
+
+def csv_total_km(csv_path):
+    """Total of the CSV's values, or None if it has no value column"""
+    df = pd.read_csv(csv_path)
+    return df['value'].sum() if 'value' in df.columns else None
+
+def find_transmission_lines_data():
+    """
+    Locate transmission lines data: the Parquet store if it has any, else the CSV
+
+    Returns:
+        tuple: (description, modification time, loader returning the total kilometres), or None
+    """
+    years = redata_store.stored_years('transmission_lines')
+    if years:
+        # Galicia's own series once a region fetch has stored it, national totals before that
+        stored = redata_store.latest_rows()
+        geo_id = redata_store.GALICIA_GEO_ID if ('transmission_lines', redata_store.GALICIA_GEO_ID) in stored \
+            else redata_store.NATIONAL_GEO_ID
+        # The newest year covers the same year the CSV did
+        return (
+            f"{redata_store.DEFAULT_STORE_DIR} ({redata_store.region_name(geo_id)}, year {years[-1]})",
+            redata_store.last_modified('transmission_lines'),
+            lambda: store_total_km(geo_id, years[-1], stored.get(('transmission_lines', geo_id)))
+        )
+
+    csv_path = find_transmission_lines_csv()
+    if csv_path:
+        return csv_path, os.path.getmtime(csv_path), lambda: csv_total_km(csv_path)
+    return None
+
 def create_transmission_lines_geojson():
     """Create GeoJSON for transmission lines based on available data"""
-    # First check if we have a CSV file with transmission lines data
-    csv_path = find_transmission_lines_csv()
+    # First check if we have transmission lines data in the store or a CSV
+    source = find_transmission_lines_data()
     
-    if not csv_path:
-        print("Error: No transmission lines CSV file found. Please run redata_api.py first.")
+    if not source:
+        print("Error: No transmission lines data found. Please run redata_api.py first.")
         return None
+    source_path, source_mtime, load_source = source
+    
+    # redata_api leaves the CSV and the store untouched when the API data
+    # hasn't changed, so a GeoJSON newer than them is already up to date
+    output_path = '../data/electrical_grid.geojson'
+    if os.path.exists(output_path) and os.path.getmtime(output_path) >= source_mtime:
+        print(f"Transmission lines GeoJSON is up to date: {output_path}")
+        return output_path
     
     # Initialize GeoJSON structure
     geojson = {
@@ -52,12 +112,11 @@ def create_transmission_lines_geojson():
     }
     
     try:
-        print(f"Using transmission lines data from: {csv_path}")
-        df = pd.read_csv(csv_path)
+        print(f"Using transmission lines data from: {source_path}")
+        total_km = load_source()
         
-        # Calculate total kilometers
-        if 'value' in df.columns:
-            total_km = df['value'].sum()
+        # Total kilometers, precomputed by the aggregate cube when the store is used
+        if total_km is not None:
             geojson["metadata"]["total_kilometers"] = total_km
             print(f"Total transmission line kilometers: {total_km}")
             
@@ -135,13 +194,12 @@ def create_transmission_lines_geojson():
             
             print(f"Added {len(geojson['features'])} features to GeoJSON.")
     except Exception as e:
-        print(f"Error processing transmission lines CSV: {e}")
+        print(f"Error processing transmission lines data: {e}")
         import traceback
         traceback.print_exc()
         return None
     
     # Save the GeoJSON to file
-    output_path = '../data/electrical_grid.geojson'
     with open(output_path, 'w', encoding='utf-8') as f:
         json.dump(geojson, f, ensure_ascii=False, indent=2)
     
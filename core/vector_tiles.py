@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+
+import numpy as np
+import shapely
+
+try:
+    import mapbox_vector_tile
+except ImportError:
+    mapbox_vector_tile = None
+
+try:
+    from core.simplify_layers import DEFAULT_LAYERS_DIR, layer_sources, level_path, zoom_band
+except ImportError:
+    from simplify_layers import DEFAULT_LAYERS_DIR, layer_sources, level_path, zoom_band
+
+# Web Mercator half-width in metres
+MERCATOR_EXTENT = 20037508.342789244
+
+# Tile coordinate extent and the margin kept around each tile so strokes don't clip at its edges
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+def lonlat_to_mercator(coords):
+    """Project an (n, 2) array of lon/lat degrees to Web Mercator metres"""
+    lon = coords[:, 0]
+    lat = np.clip(coords[:, 1], -85.05112878, 85.05112878)
+    x = np.radians(lon) * 6378137.0
+    y = np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) * 6378137.0
+    return np.column_stack([x, y])
+
+def tile_bounds(z, x, y):
+    """Web Mercator (minx, miny, maxx, maxy) of an XYZ tile"""
+    size = 2 * MERCATOR_EXTENT / (1 << z)
+    minx = -MERCATOR_EXTENT + x * size
+    maxy = MERCATOR_EXTENT - y * size
+    return minx, maxy - size, minx + size, maxy
+
+def _tile_properties(properties):
+    # MVT only carries scalar values
+    flat = {}
+    for key, value in properties.items():
+        if isinstance(value, (list, tuple)):
+            flat[key] = ','.join(str(v) for v in value)
+        elif isinstance(value, (str, int, float, bool)):
+            flat[key] = value
+    return flat
+
+
+class VectorTileSource:
+    """Cut Mapbox Vector Tiles on the fly from the zoom-band GeoJSON layers"""
+
+    def __init__(self, layers_dir=DEFAULT_LAYERS_DIR):
+        self.layers_dir = layers_dir
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available():
+        """Whether the optional mapbox_vector_tile dependency is installed"""
+        return mapbox_vector_tile is not None
+
+    def level_file(self, layer, z):
+        """GeoJSON file backing a layer's tiles at zoom z, or None for unknown layers"""
+        source = layer_sources().get(layer)
+        if source is None:
+            return None
+        path = level_path(layer, zoom_band(z), self.layers_dir)
+        return path if os.path.exists(path) else source
+
+    def version(self, layer, z):
+        """Cache key part that changes whenever the backing file is rebuilt"""
+        path = self.level_file(layer, z)
+        return None if path is None else f"{os.path.basename(path)}@{int(os.path.getmtime(path))}"
+
+    def _index(self, path):
+        """Load a level once: projected geometries, flattened properties and an STRtree over them"""
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            cached = self._indexes.get(path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+
+            with open(path, encoding='utf-8') as f:
+                features = json.load(f)['features']
+            geometries = shapely.from_geojson([json.dumps(feature['geometry']) for feature in features])
+            geometries = shapely.transform(geometries, lonlat_to_mercator)
+            properties = [_tile_properties(feature.get('properties') or {}) for feature in features]
+
+            index = (geometries, properties, shapely.STRtree(geometries))
+            self._indexes[path] = (mtime, index)
+            return index
+
+    def render(self, layer, z, x, y):
+        """Encode one tile of a layer, or return None for unknown layers"""
+        path = self.level_file(layer, z)
+        if path is None:
+            return None
+        geometries, properties, tree = self._index(path)
+
+        minx, miny, maxx, maxy = tile_bounds(z, x, y)
+        margin = (maxx - minx) * TILE_BUFFER / TILE_EXTENT
+        clip_box = (minx - margin, miny - margin, maxx + margin, maxy + margin)
+        hits = tree.query(shapely.box(*clip_box))
+        clipped = shapely.clip_by_rect(geometries[hits], *clip_box)
+
+        features = [
+            {'geometry': geometry, 'properties': properties[i]}
+            for i, geometry in zip(hits, clipped)
+            if not geometry.is_empty
+        ]
+        return mapbox_vector_tile.encode(
+            [{'name': layer, 'features': features}],
+            default_options={'quantize_bounds': (minx, miny, maxx, maxy), 'extents': TILE_EXTENT}
+        )
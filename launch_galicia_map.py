@@ -1,41 +1,50 @@
 import os
 import webbrowser
-import subprocess
 import time
-from core.authenticate_ee import authenticate_earth_engine
 import core.galicia_satellite as galicia_satellite
 from core.transmission_lines_to_geojson import create_transmission_lines_geojson
 from core.generate_ee_tiles import generate_tile_urls
+from core.tile_server import start_server
+from core.simplify_layers import build_simplified_layers
+from core import instrumentation
+
+TRACE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'launch_trace.json')
 
 def main():
     print("\n===== Galicia Map Launcher =====\n")
     
-    # Step 1: Generate satellite imagery data
-    print("Step 1: Authenticating with Earth Engine...")
-    authenticate_earth_engine()
+    # Time every stage and Earth Engine/HTTP call; the summary table is printed
+    # and the JSON trace written when the launcher exits
+    instrumentation.enable(TRACE_PATH)
+    
+    # Step 1: Generate satellite tile URLs (Earth Engine is only authenticated
+    # and queried when a cached map ID is missing or has expired)
+    print("Step 1: Generating satellite tile URLs...")
+    with instrumentation.span('stage', 'generate_tile_urls'):
+        generate_tile_urls()
     
-    # Step 2: Generate fresh satellite tile URLs
-    print("\nStep 2: Generating satellite tile URLs...")
-    generate_tile_urls()
+    # Step 2: Generate electrical grid data
+    print("\nStep 2: Generating electrical grid data...")
+    with instrumentation.span('stage', 'create_transmission_lines_geojson'):
+        create_transmission_lines_geojson()
     
-    # Step 3: Generate electrical grid data
-    print("\nStep 3: Generating electrical grid data...")
-    create_transmission_lines_geojson()
+    # Precompute zoom-band simplified levels of the grid and polygon layers
+    # (layers whose levels are newer than their source are skipped)
+    with instrumentation.span('stage', 'build_simplified_layers'):
+        build_simplified_layers()
     
-    # Step 4: Start a local web server
-    print("\nStep 4: Starting local web server...")
-    server_process = None
+    # Step 3: Start a local web server
+    print("\nStep 3: Starting local web server...")
+    server = None
     
     try:
-        # Use Python's built-in HTTP server
-        cmd = ['python', '-m', 'http.server', '8000']
-        server_process = subprocess.Popen(cmd)
-        
-        # Give the server a moment to start
-        time.sleep(1)
+        # Serve the project files plus the caching /tiles/ proxy, so repeat
+        # pans and zooms are answered from the local tile cache
+        with instrumentation.span('stage', 'start_server'):
+            server = start_server(port=8000)
         
-        # Step 5: Open the map in the default browser
-        print("\nStep 5: Opening map in browser...")
+        # Step 4: Open the map in the default browser
+        print("\nStep 4: Opening map in browser...")
         # Default to the integrated map, but allow choosing others
         map_url = "http://localhost:8000/mapping/galicia_integrated_map.html"
         webbrowser.open(map_url)
@@ -53,9 +62,9 @@ def main():
             print("\nShutting down the server...")
     
     finally:
-        # Clean up the server process when done
-        if server_process:
-            server_process.terminate()
+        # Clean up the server when done
+        if server:
+            server.shutdown()
 
 if __name__ == "__main__":
     main()